@@ -1,6 +1,8 @@
+from .rng import RandomStream, random_uniform, random_uniform_batch, hash_batch, pcg4d
 from .camera import *
 from .ray import *
-from .hit import HitPoint
+from .hit import HitPoint, HitRecord
 from .vec_utils import *
 from .multithread import *
-from .bvh import *
\ No newline at end of file
+from .bvh import *
+from .linear_bvh import LinearBVH
\ No newline at end of file
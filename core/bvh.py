@@ -2,8 +2,9 @@ import functools
 import random
 
 import numba as nb
+import numpy as np
 
-from geometries import Hitable, sorrounding_box
+from geometries import Hitable, HitableList, sorrounding_box
 
 rint = random.randint
 
@@ -23,7 +24,7 @@ def compare_bbox(axis=0):
         # return -1 if the right is bigger than the left, 1 if the opposite and 0 if they are equal
         if (bbox_0.min[axis] - bbox_1.min[axis]) < 0:
             return -1
-        elif (bbox_0.min[axis] - bbox_1.min)[axis] > 0:
+        elif (bbox_0.min[axis] - bbox_1.min[axis]) > 0:
             return 1
         else:
             return 0
@@ -32,21 +33,51 @@ def compare_bbox(axis=0):
 
 
 class BVH_node(Hitable):
-    def __init__(self, hitable_list, time0, time1):
+    """
+    Bounding Volume Hierarchy node.
 
+    Two build strategies are available:
+        - 'median': random split axis and split at the middle of the sorted list of hitables
+        - 'sah': binned Surface Area Heuristic, see SAHBuilder
+    """
+
+    def __init__(self, hitable_list, time0, time1, strategy='median', leaf_size=4, n_bins=12):
+        if strategy == 'median':
+            self._build_median(hitable_list, time0, time1)
+        elif strategy == 'sah':
+            root = SAHBuilder(hitable_list, time0, time1, leaf_size=leaf_size, n_bins=n_bins).build()
+            self._set_children(root.left, root.right, root.axis, time0, time1)
+        else:
+            raise Exception('Unknown BVH build strategy: %s' % strategy)
+
+    @classmethod
+    def from_children(cls, left, right, axis, time0, time1):
+        # create a node from already built children, skipping the median construction
+        node = cls.__new__(cls)
+        node._set_children(left, right, axis, time0, time1)
+        return node
+
+    def _build_median(self, hitable_list, time0, time1):
         n = len(hitable_list)
         axis = rint(0, 2)
-        sorted(hitable_list, key=functools.cmp_to_key(compare_bbox(axis)))
+        hitable_list = sorted(hitable_list, key=functools.cmp_to_key(compare_bbox(axis)))
 
         if n == 1:  # case of single item in the hitable list
-            self.left = self.right = hitable_list[0]
+            left = right = hitable_list[0]
 
         elif n == 2:  # case of two items in the hitable list
-            self.left, self.right = hitable_list[0], hitable_list[1]
+            left, right = hitable_list[0], hitable_list[1]
 
         else:
-            self.left = BVH_node(hitable_list[:n // 2], time0, time1)
-            self.right = BVH_node(hitable_list[n // 2:], time0, time1)
+            left = BVH_node(hitable_list[:n // 2], time0, time1)
+            right = BVH_node(hitable_list[n // 2:], time0, time1)
+
+        self._set_children(left, right, axis, time0, time1)
+
+    def _set_children(self, left, right, axis, time0, time1):
+        self.left, self.right = left, right
+        self.axis = axis
+        self.time0, self.time1 = time0, time1
 
         is_left_bbox, left_bbox = self.left.bounding_box(time0, time1)
         is_right_bbox, right_bbox = self.right.bounding_box(time0, time1)
@@ -57,7 +88,8 @@ class BVH_node(Hitable):
         self.bbox = sorrounding_box(left_bbox, right_bbox)
 
     def hit(self, ray, t_min, t_max):
-        if self.bbox.hit(ray, t_min, t_max):
+        is_bbox_hit, _ = self.bbox.hit(ray, t_min, t_max)
+        if is_bbox_hit:
 
             # hit the left branch
             left_hit, left_record = self.left.hit(ray, t_min, t_max)
@@ -78,5 +110,159 @@ class BVH_node(Hitable):
         # if nothing was hit
         return False, None
 
+    def occluded(self, ray, t_min, t_max):
+        # stop at the first hit, the right branch is only visited if nothing was hit in the left one
+        is_bbox_hit, _ = self.bbox.hit(ray, t_min, t_max)
+        if not is_bbox_hit:
+            return False
+        return self.left.occluded(ray, t_min, t_max) or \
+               (self.right is not self.left and self.right.occluded(ray, t_min, t_max))
+
     def bounding_box(self, t0, t1):
         return True, self.bbox
+
+
+class SAHBuilder(object):
+    """
+    Binned Surface Area Heuristic (SAH) BVH builder.
+
+    The bounds and centroid of every primitive are computed once. At each node the centroids are
+    binned along every axis and the split with the lowest estimated cost is taken:
+
+        cost = traversal_cost + (area_left * n_left + area_right * n_right) / area_node
+
+    Nodes with at most leaf_size primitives, or whose best split is not cheaper than intersecting
+    all of their primitives, become leaves (the primitive itself or a HitableList).
+    """
+
+    def __init__(self, hitable_list, time0, time1, leaf_size=4, n_bins=12, traversal_cost=0.125):
+        if len(hitable_list) == 0:
+            raise Exception('Cannot build a BVH from an empty hitable list')
+
+        self.hitables = list(hitable_list)
+        self.time0, self.time1 = time0, time1
+        self.leaf_size = max(1, leaf_size)
+        self.n_bins = n_bins
+        self.traversal_cost = traversal_cost
+
+        # compute the bounds and centroid of each primitive only once
+        self.mins = np.zeros((len(self.hitables), 3))
+        self.maxs = np.zeros((len(self.hitables), 3))
+        for idx, hitable in enumerate(self.hitables):
+            is_bbox, bbox = hitable.bounding_box(time0, time1)
+            if not is_bbox:
+                raise Exception('No bounding box in SAH BVH builder')
+            self.mins[idx], self.maxs[idx] = bbox.min, bbox.max
+        self.centroids = 0.5 * (self.mins + self.maxs)
+
+    def build(self):
+        root = self._build(np.arange(len(self.hitables)))
+
+        # the root is always a BVH_node, even if all the primitives fit in a single leaf
+        if not isinstance(root, BVH_node):
+            root = BVH_node.from_children(root, root, 0, self.time0, self.time1)
+        return root
+
+    def _build(self, idxs):
+        n = len(idxs)
+        if n == 1:
+            return self._make_leaf(idxs)
+
+        axis, split, cost = self._find_split(idxs)
+
+        # leaf if the split is not worth it and the primitives fit in a leaf
+        if n <= self.leaf_size and (axis is None or cost >= n):
+            return self._make_leaf(idxs)
+
+        if axis is None:  # all centroids are in the same position, split in the middle
+            axis = 0
+            left_idxs, right_idxs = idxs[:n // 2], idxs[n // 2:]
+        else:
+            mask = self._bin_ids(idxs, axis) <= split
+            left_idxs, right_idxs = idxs[mask], idxs[~mask]
+
+        left = self._build(left_idxs)
+        right = self._build(right_idxs)
+        return BVH_node.from_children(left, right, axis, self.time0, self.time1)
+
+    def _make_leaf(self, idxs):
+        if len(idxs) == 1:
+            return self.hitables[idxs[0]]
+        return HitableList([self.hitables[idx] for idx in idxs])
+
+    def _bin_ids(self, idxs, axis):
+        c_min = self.centroids[idxs, axis].min()
+        c_max = self.centroids[idxs, axis].max()
+        bins = ((self.centroids[idxs, axis] - c_min) * (self.n_bins / (c_max - c_min))).astype(np.int64)
+        return np.minimum(bins, self.n_bins - 1)
+
+    def _find_split(self, idxs):
+        """
+        returns the axis, the last bin of the left child and the relative cost of the best split.
+        The axis is None if the centroids can not be separated.
+        """
+        node_area = surface_area(self.mins[idxs].min(axis=0), self.maxs[idxs].max(axis=0))
+        extent = self.centroids[idxs].max(axis=0) - self.centroids[idxs].min(axis=0)
+
+        best_axis, best_split, best_cost = None, None, float('inf')
+        for axis in range(3):
+            if extent[axis] <= 0.:
+                continue
+
+            bins = self._bin_ids(idxs, axis)
+
+            # number of primitives and bounds of each bin
+            counts = np.bincount(bins, minlength=self.n_bins)
+            bin_mins = np.full((self.n_bins, 3), np.inf)
+            bin_maxs = np.full((self.n_bins, 3), -np.inf)
+            np.minimum.at(bin_mins, bins, self.mins[idxs])
+            np.maximum.at(bin_maxs, bins, self.maxs[idxs])
+
+            # sweep from the left and from the right to get the cost of splitting after each bin
+            left_counts = np.cumsum(counts)[:-1]
+            right_counts = np.cumsum(counts[::-1])[::-1][1:]
+            left_areas = surface_area(np.minimum.accumulate(bin_mins)[:-1],
+                                      np.maximum.accumulate(bin_maxs)[:-1])
+            right_areas = surface_area(np.minimum.accumulate(bin_mins[::-1])[::-1][1:],
+                                       np.maximum.accumulate(bin_maxs[::-1])[::-1][1:])
+
+            costs = self.traversal_cost + (left_counts * left_areas + right_counts * right_areas) / node_area
+            costs[(left_counts == 0) | (right_counts == 0)] = np.inf
+
+            split = int(np.argmin(costs))
+            if costs[split] < best_cost:
+                best_axis, best_split, best_cost = axis, split, costs[split]
+
+        if best_axis is None or not np.isfinite(best_cost):
+            return None, None, float('inf')
+        return best_axis, best_split, best_cost
+
+
+def surface_area(mins, maxs):
+    # surface area of one or several boxes, empty boxes have zero area
+    d = np.maximum(maxs - mins, 0.)
+    return 2. * (d[..., 0] * d[..., 1] + d[..., 1] * d[..., 2] + d[..., 2] * d[..., 0])
+
+
+def count_node_visits(hitable, ray, t_min, t_max):
+    """
+    Same traversal as BVH_node.hit but also returns the number of BVH nodes visited by the ray.
+    It is meant to compare build strategies, not to render.
+    """
+    if not isinstance(hitable, BVH_node):
+        is_hit, record = hitable.hit(ray, t_min, t_max)
+        return is_hit, record, 0
+
+    visits = 1
+    if not hitable.bbox.hit(ray, t_min, t_max)[0]:
+        return False, None, visits
+
+    left_hit, record, left_visits = count_node_visits(hitable.left, ray, t_min, t_max)
+    if left_hit:
+        t_max = record.t
+
+    right_hit, right_record, right_visits = count_node_visits(hitable.right, ray, t_min, t_max)
+    if right_hit:
+        record = right_record
+
+    return left_hit or right_hit, record, visits + left_visits + right_visits
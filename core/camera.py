@@ -1,12 +1,10 @@
 import math
-import random
 
 import numba as nb
+import numpy as np
 
 from .ray import Ray
-from .vec_utils import unit_vector, random_in_unit_disk, cross
-
-rand = random.random
+from .vec_utils import unit_vector, random_in_unit_disk, concentric_disk, cross
 
 spec = [
     ('time_0', nb.int64),
@@ -52,11 +50,65 @@ class Camera(object):
         self.horizontal = 2 * half_width * self.u * focus_dist
         self.vertical = 2 * half_height * self.v * focus_dist
 
-    def get_ray(self, s, t):
-        random_lens_point = self.lens_radius * random_in_unit_disk()
+    def get_ray(self, s, t, rng):
+        # the lens point and the time are drawn from the RandomStream rng
+        random_lens_point = self.lens_radius * random_in_unit_disk(rng)
         offset = self.u * random_lens_point[0] + self.v * random_lens_point[1]
-        time = self.time_0 + rand() * (self.time_1 - self.time_0)
+        time = self.time_0 + rng.next() * (self.time_1 - self.time_0)
 
         origin = self.origin + offset
         direction = self.low_left_corner + s * self.horizontal + t * self.vertical - self.origin - offset
         return Ray(origin, direction, time)
+
+    def get_rays(self, s, t, lens_samples, time_samples):
+        """
+        batched get_ray for a tile of N samples: (N,) screen coordinates s and t, (N, 2) lens and (N,) time
+        uniform numbers. The lens point uses the concentric disk mapping of the numbers, so the rays are the ones
+        get_ray gives with the same numbers. Returns the (N, 3) origins and directions and (N,) times
+        """
+        n = s.shape[0]
+        origins, directions, times = np.empty((n, 3)), np.empty((n, 3)), np.empty(n)
+        for idx in range(n):
+            lens_point = self.lens_radius * concentric_disk(lens_samples[idx, 0], lens_samples[idx, 1])
+            offset = self.u * lens_point[0] + self.v * lens_point[1]
+            origins[idx] = self.origin + offset
+            directions[idx] = self.low_left_corner + s[idx] * self.horizontal + t[idx] * self.vertical - \
+                              self.origin - offset
+            times[idx] = self.time_0 + time_samples[idx] * (self.time_1 - self.time_0)
+        return origins, directions, times
+
+
+_state_fields = ('time_0', 'time_1', 'w', 'u', 'v', 'low_left_corner', 'origin', 'lens_radius', 'horizontal',
+                 'vertical')
+
+
+def camera_state(camera):
+    """
+    returns the camera fields as a tuple. Camera instances can not be pickled, the state is a small
+    picklable description that can be sent to other processes and rebuilt with camera_from_state
+    """
+    return tuple(getattr(camera, field) for field in _state_fields)
+
+
+def camera_from_state(state):
+    # create a camera with placeholder parameters and overwrite all its fields
+    camera = Camera(np.array([0., 0., 1.]), np.zeros(3), np.array([0., 1., 0.]), 90., 1., 0., 1., 0, 1)
+    for field, value in zip(_state_fields, state):
+        setattr(camera, field, value)
+    return camera
+
+
+def project(camera, points):
+    """
+    returns the (N, 2) screen coordinates (s, t) in [0, 1] of camera.get_ray of the (N, 3) world points, seen
+    from the center of the lens
+    """
+    to_points = points - camera.origin
+    to_corner = camera.low_left_corner - camera.origin
+    focus_dist = -np.dot(to_corner, camera.w)
+
+    # scale the points to the focus plane, where the screen is
+    scale = focus_dist / np.maximum(-to_points.dot(camera.w), 1e-12)
+    s = (scale * to_points.dot(camera.u) - np.dot(to_corner, camera.u)) / np.linalg.norm(camera.horizontal)
+    t = (scale * to_points.dot(camera.v) - np.dot(to_corner, camera.v)) / np.linalg.norm(camera.vertical)
+    return np.stack([s, t], axis=1)
@@ -1,6 +1,33 @@
+import numba as nb
+
+
 class HitPoint(object):
-    def __init__(self, point, normal, material, t):
+    def __init__(self, point, normal, material, t, material_id=-1, velocity=None):
         self.t = t
         self.point = point
         self.normal = normal
         self.material = material
+        self.material_id = material_id  # index of the material in the materials of the world, -1 if unknown
+        self.velocity = velocity  # velocity of the surface, None if it is static
+
+
+spec = [
+    ('t', nb.float64),
+    ('point', nb.float64[:]),
+    ('normal', nb.float64[:]),
+    ('material_id', nb.int64),
+]
+
+
+@nb.jitclass(spec)
+class HitRecord(object):
+    """
+    Compiled counterpart of HitPoint used inside nopython kernels, the material is given by its index
+    in a MaterialTable
+    """
+
+    def __init__(self, t, point, normal, material_id):
+        self.t = t
+        self.point = point
+        self.normal = normal
+        self.material_id = material_id
@@ -0,0 +1,243 @@
+import numba as nb
+import numpy as np
+
+from geometries import Hitable, HitableList, AABB, SphereSet, sphere_intersect
+from .bvh import BVH_node
+
+
+class LinearBVH(Hitable):
+    """
+    Flattened BVH stored in contiguous arrays.
+
+    The nodes of a BVH_node tree are stored in depth-first order, so the first child of an interior
+    node is always the next node in the arrays:
+        - node_mins, node_maxs: bounds of each node
+        - node_offsets: index of the second child for interior nodes, first primitive for leaves
+        - node_counts: number of primitives of a leaf, 0 for interior nodes
+        - node_axes: split axis of interior nodes
+
+    The primitives are stored in a SphereSet, reordered so that every leaf covers a contiguous range of them.
+    Traversal runs in a nopython loop with an explicit stack and visits the nearer child first.
+    """
+
+    def __init__(self, bvh):
+        self.time0, self.time1 = getattr(bvh, 'time0', 0), getattr(bvh, 'time1', 1)
+
+        node_mins, node_maxs, node_offsets, node_counts, node_axes = [], [], [], [], []
+        primitives = []
+
+        def add_node(min, max, offset, count, axis):
+            node_mins.append(min)
+            node_maxs.append(max)
+            node_offsets.append(offset)
+            node_counts.append(count)
+            node_axes.append(axis)
+            return len(node_mins) - 1
+
+        def flatten(hitable, depth):
+            # interior node, the second child offset is filled once the first subtree is flattened
+            if isinstance(hitable, BVH_node) and hitable.left is not hitable.right:
+                node_idx = add_node(hitable.bbox.min, hitable.bbox.max, 0, 0, hitable.axis)
+                left_depth = flatten(hitable.left, depth + 1)
+                node_offsets[node_idx] = len(node_mins)
+                right_depth = flatten(hitable.right, depth + 1)
+                return max(left_depth, right_depth)
+
+            # leaf node
+            if isinstance(hitable, BVH_node):
+                hitable = hitable.left
+            leaf_primitives = hitable.hitable_array if isinstance(hitable, HitableList) else [hitable]
+            _, bbox = hitable.bounding_box(self.time0, self.time1)
+            add_node(bbox.min, bbox.max, len(primitives), len(leaf_primitives), 0)
+            primitives.extend(leaf_primitives)
+            return depth
+
+        self.max_depth = flatten(bvh, 0)
+
+        self.node_mins = np.array(node_mins, dtype=np.float64)
+        self.node_maxs = np.array(node_maxs, dtype=np.float64)
+        self.node_offsets = np.array(node_offsets, dtype=np.int32)
+        self.node_counts = np.array(node_counts, dtype=np.int32)
+        self.node_axes = np.array(node_axes, dtype=np.int32)
+
+        self.spheres = SphereSet.from_hitables(primitives)
+
+    def intersect(self, origin, direction, time, t_min, t_max):
+        """
+        returns the index of the closest primitive hit (-1 if none), the hit distance and the number
+        of nodes visited
+        """
+        return _intersect(origin, direction, time, t_min, t_max,
+                          self.node_mins, self.node_maxs, self.node_offsets, self.node_counts, self.node_axes,
+                          self.spheres.centers, self.spheres.velocities, self.spheres.radii, self.max_depth + 1)
+
+    def occluded(self, ray, t_min, t_max):
+        return _occluded(ray.origin, ray.direction, ray.time, t_min, t_max,
+                         self.node_mins, self.node_maxs, self.node_offsets, self.node_counts,
+                         self.spheres.centers, self.spheres.velocities, self.spheres.radii, self.max_depth + 1)
+
+    def hit_batch(self, origins, directions, times, t_min, t_max):
+        """
+        intersect N rays given as (N, 3) origins and directions and (N,) times.
+        Returns the (N,) primitive indices (-1 for no hit) and hit distances
+        """
+        return _intersect_batch(origins, directions, times, t_min, t_max,
+                                self.node_mins, self.node_maxs, self.node_offsets, self.node_counts, self.node_axes,
+                                self.spheres.centers, self.spheres.velocities, self.spheres.radii, self.max_depth + 1)
+
+    def occluded_batch(self, origins, directions, times, t_min, t_max):
+        """
+        any-hit query of N rays, t_min and t_max can be scalars or (N,) arrays. Returns a (N,) boolean mask
+        of the rays that hit a primitive
+        """
+        n = origins.shape[0]
+        return _occluded_batch(origins, directions, times, np.broadcast_to(np.float64(t_min), n),
+                               np.broadcast_to(np.float64(t_max), n),
+                               self.node_mins, self.node_maxs, self.node_offsets, self.node_counts,
+                               self.spheres.centers, self.spheres.velocities, self.spheres.radii, self.max_depth + 1)
+
+    def surface_batch(self, idxs, origins, directions, times, ts):
+        return self.spheres.surface_batch(idxs, origins, directions, times, ts)
+
+    def velocity_batch(self, idxs):
+        return self.spheres.velocity_batch(idxs)
+
+    @property
+    def materials(self):
+        return self.spheres.materials
+
+    def hit(self, ray, t_min, t_max):
+        prim, t, _ = self.intersect(ray.origin, ray.direction, ray.time, t_min, t_max)
+        if prim < 0:
+            return False, None
+        return True, self.spheres.hit_record(prim, ray, t)
+
+    def bounding_box(self, t0, t1):
+        return True, AABB(self.node_mins[0].copy(), self.node_maxs[0].copy())
+
+    def __len__(self):
+        return len(self.spheres)
+
+
+@nb.jit(nopython=True)
+def _hit_node(inv_direction, origin, node_min, node_max, t_min, t_max):
+    for axis in range(3):
+        t0 = (node_min[axis] - origin[axis]) * inv_direction[axis]
+        t1 = (node_max[axis] - origin[axis]) * inv_direction[axis]
+        if t0 > t1:
+            t0, t1 = t1, t0
+        t_min = max(t0, t_min)
+        t_max = min(t1, t_max)
+        if t_max <= t_min:
+            return False
+    return True
+
+
+@nb.jit(nopython=True)
+def _intersect(origin, direction, time, t_min, t_max,
+               node_mins, node_maxs, node_offsets, node_counts, node_axes,
+               centers, velocities, radii, stack_size):
+    inv_direction = np.empty(3)
+    for axis in range(3):
+        inv_direction[axis] = 1. / direction[axis] if direction[axis] != 0. else np.inf
+
+    stack = np.empty(stack_size, dtype=np.int64)
+    stack_ptr = 0
+    node = 0
+    visits = 0
+
+    closest = t_max
+    hit_prim = -1
+
+    while True:
+        visits += 1
+        if _hit_node(inv_direction, origin, node_mins[node], node_maxs[node], t_min, closest):
+            count = node_counts[node]
+            if count > 0:  # leaf, intersect all its primitives
+                first = node_offsets[node]
+                for prim in range(first, first + count):
+                    t = sphere_intersect(origin, direction, centers[prim] + time * velocities[prim], radii[prim],
+                                         t_min, closest)
+                    if t < closest:
+                        closest = t
+                        hit_prim = prim
+
+                if stack_ptr == 0:
+                    break
+                stack_ptr -= 1
+                node = stack[stack_ptr]
+
+            else:  # interior node, visit the nearer child first and push the other one
+                if direction[node_axes[node]] < 0.:
+                    stack[stack_ptr] = node + 1
+                    node = node_offsets[node]
+                else:
+                    stack[stack_ptr] = node_offsets[node]
+                    node = node + 1
+                stack_ptr += 1
+
+        else:
+            if stack_ptr == 0:
+                break
+            stack_ptr -= 1
+            node = stack[stack_ptr]
+
+    return hit_prim, closest, visits
+
+
+@nb.jit(nopython=True)
+def _occluded(origin, direction, time, t_min, t_max,
+              node_mins, node_maxs, node_offsets, node_counts,
+              centers, velocities, radii, stack_size):
+    # any-hit traversal, returns on the first primitive hit inside (t_min, t_max) in any order
+    inv_direction = np.empty(3)
+    for axis in range(3):
+        inv_direction[axis] = 1. / direction[axis] if direction[axis] != 0. else np.inf
+
+    stack = np.empty(stack_size, dtype=np.int64)
+    stack[0] = 0
+    stack_ptr = 1
+    while stack_ptr > 0:
+        stack_ptr -= 1
+        node = stack[stack_ptr]
+        if not _hit_node(inv_direction, origin, node_mins[node], node_maxs[node], t_min, t_max):
+            continue
+
+        count = node_counts[node]
+        if count > 0:
+            first = node_offsets[node]
+            for prim in range(first, first + count):
+                if sphere_intersect(origin, direction, centers[prim] + time * velocities[prim], radii[prim],
+                                    t_min, t_max) < t_max:
+                    return True
+        else:
+            stack[stack_ptr] = node_offsets[node]
+            stack[stack_ptr + 1] = node + 1
+            stack_ptr += 2
+    return False
+
+
+@nb.jit(nopython=True)
+def _intersect_batch(origins, directions, times, t_min, t_max,
+                     node_mins, node_maxs, node_offsets, node_counts, node_axes,
+                     centers, velocities, radii, stack_size):
+    n = origins.shape[0]
+    prims = np.empty(n, dtype=np.int64)
+    ts = np.empty(n)
+    for idx in range(n):
+        prims[idx], ts[idx], _ = _intersect(origins[idx], directions[idx], times[idx], t_min, t_max,
+                                            node_mins, node_maxs, node_offsets, node_counts, node_axes,
+                                            centers, velocities, radii, stack_size)
+    return prims, ts
+
+
+@nb.jit(nopython=True)
+def _occluded_batch(origins, directions, times, t_mins, t_maxs,
+                    node_mins, node_maxs, node_offsets, node_counts,
+                    centers, velocities, radii, stack_size):
+    occluded = np.empty(origins.shape[0], dtype=np.bool_)
+    for idx in range(origins.shape[0]):
+        occluded[idx] = _occluded(origins[idx], directions[idx], times[idx], t_mins[idx], t_maxs[idx],
+                                  node_mins, node_maxs, node_offsets, node_counts,
+                                  centers, velocities, radii, stack_size)
+    return occluded
@@ -1,41 +1,406 @@
+import json
+import os
+import time
+
 import numpy as np
+from pathos.helpers import mp
 from pathos.multiprocessing import Pool
-import sys
+
+from films import SharedFramebuffer
+from .camera import camera_state, camera_from_state
+from .telemetry import Telemetry, ProgressMonitor
+
+# state of each worker process, the world is set once per worker, the camera is cached by render id
+# and the shared memory blocks the worker is attached to by their descriptors
+_worker_state = {'world': None, 'render_id': None, 'camera': None, 'framebuffer': None, 'telemetry': None}
+
+
+def create_tiles(width, height, tile_size):
+    """
+    splits the canvas into square tiles of tile_size x tile_size pixels (smaller at the borders).
+    Returns the tiles in scanline order as (col_start, row_start, col_end, row_end) tuples
+    """
+    return [(col_start, row_start, min(col_start + tile_size, width), min(row_start + tile_size, height))
+            for row_start in range(0, height, tile_size)
+            for col_start in range(0, width, tile_size)]
+
+
+def tile_pixels(tile):
+    # returns the (cols, rows) coordinates of all the pixels in the tile
+    col_start, row_start, col_end, row_end = tile
+    cols, rows = np.meshgrid(np.arange(col_start, col_end), np.arange(row_start, row_end))
+    return cols.flatten(), rows.flatten()
+
+
+def render_tile(integrator, camera, world, framebuffer, telemetry, tile_idx, tile, active=None, deadline=None):
+    """
+    renders a single tile, writes it into the framebuffer and times it. active masks the pixels to render.
+    Tiles that start after the deadline (a time.time() value) are skipped and their time is None
+    """
+    start = time.time()
+    if deadline is not None and start > deadline:
+        return tile_idx, None, os.getpid()
+
+    cols, rows = tile_pixels(tile)
+    if active is not None:
+        cols, rows = cols[active], rows[active]
+    reporter = telemetry.reporter(tile_idx)
+    radiance, n_samples, aovs = integrator.render(cols, rows, camera, world, reporter)
+    framebuffer.write_tile(cols, rows, radiance, n_samples, aovs)
+    reporter.flush()
+    return tile_idx, time.time() - start, os.getpid()
+
+
+def _init_worker(world):
+    # only used when the workers can not inherit the world from the parent process
+    _worker_state['world'] = world
+
+
+def _attach(key, cls, descriptor):
+    # attach the worker to a shared memory object, only when it changes
+    attached = _worker_state[key]
+    if attached is None or attached.descriptor != descriptor:
+        if attached is not None:
+            attached.close()
+        attached = _worker_state[key] = cls.attach(descriptor)
+    return attached
+
+
+def _render_job(job):
+    """
+    renders the tile described by a job descriptor (tile_idx, tile, render_id, camera state, integrator,
+    framebuffer descriptor, telemetry descriptor, active pixels mask, deadline) using the world stored in the worker
+    """
+    tile_idx, tile, render_id, state, integrator, framebuffer_descriptor, telemetry_descriptor, active, deadline = job
+
+    # rebuild the camera only once per render call
+    if _worker_state['render_id'] != render_id:
+        _worker_state['camera'] = camera_from_state(state)
+        _worker_state['render_id'] = render_id
+
+    framebuffer = _attach('framebuffer', SharedFramebuffer, framebuffer_descriptor)
+    telemetry = _attach('telemetry', Telemetry, telemetry_descriptor)
+
+    return render_tile(integrator, _worker_state['camera'], _worker_state['world'], framebuffer, telemetry,
+                       tile_idx, tile, active, deadline)
+
+
+class RenderPool(object):
+    """
+    Persistent pool of render workers.
+
+    The world (and its acceleration structure) is sent to the workers only once, when the pool is
+    created. With the fork start method the workers inherit it from the parent as read-only memory
+    and nothing is serialized; otherwise it is pickled once per worker through the pool initializer.
+
+    Every render call only sends small job descriptors: the tile bounds, the camera state, the
+    integrator parameters and the names of the shared framebuffer and telemetry the tiles are written to.
+    """
+
+    def __init__(self, world, n_cores):
+        self.n_cores = n_cores
+        self.render_id = 0
+        self.pool = None
+        self.set_world(world)
+
+    def set_world(self, world):
+        # (re)start the workers with a new world
+        self.close()
+        self.world = world
+
+        _worker_state['world'] = world
+        if mp.get_start_method() == 'fork':
+            self.pool = Pool(processes=self.n_cores)
+        else:
+            self.pool = Pool(processes=self.n_cores, initializer=_init_worker, initargs=(world,))
+
+    def imap(self, camera, integrator, framebuffer, telemetry, tiles, masks=None, deadline=None):
+        """
+        renders the tiles, given as (tile_idx, tile) pairs, with the camera and integrator into the framebuffer.
+        masks optionally gives the pixels to render of every tile and the tiles taken after the deadline
+        are skipped. Returns an iterator over (tile_idx, seconds, worker pid) in the order the tiles are finished
+        """
+        self.render_id += 1
+        state = camera_state(camera)
+        masks = masks if masks is not None else [None] * len(tiles)
+        jobs = [(tile_idx, tile, self.render_id, state, integrator, framebuffer.descriptor, telemetry.descriptor,
+                 active, deadline) for (tile_idx, tile), active in zip(tiles, masks)]
+        return self.pool.imap_unordered(_render_job, jobs, chunksize=1)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
 
 
 class Multithread(object):
+    """
+    Renders the image split in tiles.
+
+    The tiles are kept in an ordered queue and every worker pulls the next tile as soon as it finishes
+    the previous one, so expensive regions of the image do not leave the other workers idle.
+    The time spent on each tile is stored in tile_times.
+
+    The tiles are written into a SharedFramebuffer, out_img is the gamma corrected image of its
+    current content and can be read while rendering.
 
-    def __init__(self, camera, world, n_cores):
+    The workers report their progress through a shared Telemetry and a single ProgressMonitor in
+    this process shows the progress, ETA and rays/sec. Nothing is printed if silent is True.
+
+    The worker pool is created on the first multithread run and reused by the following ones, so
+    rendering again with more samples or a new camera does not send the world again. Call close()
+    to stop the workers.
+    """
+
+    def __init__(self, camera, world, n_cores, tile_size=16, silent=False):
         self.n_cores = n_cores
         self.camera = camera
         self.world = world
+        self.tile_size = tile_size
+        self.silent = silent
+        self.render_pool = None
+        self.framebuffer = None
+        self.telemetry = None
+        self.stats = {}
 
-    def create_working_pool(self, width, height):
-        self.out_img = np.zeros((height, width, 3))
+    def create_working_pool(self, width, height, tile_size=None, aovs=None):
         self.width, self.height = width, height
 
-        matrix_pool = np.meshgrid(np.arange(width), np.arange(height))
-        self.rows_pool = matrix_pool[0].reshape(self.n_cores, -1)
-        self.cols_pool = matrix_pool[1].reshape(self.n_cores, -1)
+        if self.framebuffer is not None:
+            self.framebuffer.close()
+        self.framebuffer = SharedFramebuffer(width, height, aovs)
+
+        if tile_size is not None:
+            self.tile_size = tile_size
+        self.tiles = create_tiles(width, height, self.tile_size)
+
+        if self.telemetry is not None:
+            self.telemetry.close()
+        self.telemetry = Telemetry(len(self.tiles))
+
+        self.tile_times = np.zeros(len(self.tiles))
+        self.tile_workers = np.zeros(len(self.tiles), dtype=np.int64)
+
+    @property
+    def out_img(self):
+        return self.framebuffer.image()
+
+    def run(self, integrator, accumulate=False, on_tile=None, active=None, deadline=None):
+        """
+        renders all the tiles with the integrator. The samples are added to the ones already in the
+        framebuffer if accumulate is True. on_tile(tile_idx) is called every time a tile is finished,
+        for example to show a preview of out_img.
+
+        When accumulating, the sample_offset of the integrator is moved past the samples already in the
+        framebuffer, so the new samples draw new random numbers. Otherwise it is reset to zero, so the same
+        integrator always gives the same image.
+
+        active is an optional (height, width) boolean mask of the pixels to render, the tiles without
+        active pixels are skipped.
+
+        If a deadline (a time.time() value) is given, the tiles being rendered when it is reached are
+        finished and the ones not started yet are skipped. Returns the number of tiles rendered
+        """
+        if accumulate:
+            integrator.sample_offset = int(self.framebuffer.counts.max())
+        else:
+            integrator.sample_offset = 0
+            self.framebuffer.clear()
+        self.telemetry.clear()
+
+        tiles, masks = list(enumerate(self.tiles)), None
+        if active is not None:
+            masks = [active[row_start:row_end, col_start:col_end].flatten()
+                     for col_start, row_start, col_end, row_end in self.tiles]
+            tiles = [tile for tile, mask in zip(tiles, masks) if mask.any()]
+            masks = [mask for mask in masks if mask.any()]
+        total_pixels = self.width * self.height if active is None else int(active.sum())
 
-    def run(self, integrator):
         if self.n_cores == 1:  # run single thread
-            self.out_img = integrator.run(self.rows_pool[0],
-                                          self.cols_pool[0],
-                                          self.camera.get_ray,
-                                          self.world)[0].reshape((self.height, self.width, 3))
-        else:  # run multithread
-            pool = Pool(processes=self.n_cores)  # create pool of threads
-            results = [pool.apply_async(
-                integrator.run,
-                args=(self.rows_pool[core_idx],
-                      self.cols_pool[core_idx],
-                      self.camera.get_ray,
-                      self.world)
-            ) for core_idx in range(self.n_cores)]
-
-            output = [p.get() for p in results]  # get results
-
-            # map results to the resulting image
-            for out in output:
-                self.out_img[out[1], out[2], :] = out[0]
+            results = (render_tile(integrator, self.camera, self.world, self.framebuffer, self.telemetry,
+                                   tile_idx, tile, masks[idx] if masks is not None else None, deadline)
+                       for idx, (tile_idx, tile) in enumerate(tiles))
+
+        else:  # run multithread, each worker takes the next tile of the queue when it finishes one
+            if self.render_pool is None:
+                self.render_pool = RenderPool(self.world, self.n_cores)
+            elif self.render_pool.world is not self.world:  # new scene, restart the workers with it
+                self.render_pool.set_world(self.world)
+            results = self.render_pool.imap(self.camera, integrator, self.framebuffer, self.telemetry, tiles, masks,
+                                            deadline)
+
+        # the tiles are already in the framebuffer, only keep track of the timings
+        n_rendered = 0
+        with ProgressMonitor(self.telemetry, total_pixels, silent=self.silent) as monitor:
+            for tile_idx, seconds, worker in results:
+                if seconds is None:  # skipped after the deadline
+                    continue
+                n_rendered += 1
+                self.tile_times[tile_idx] = seconds
+                self.tile_workers[tile_idx] = worker
+                if on_tile is not None:
+                    on_tile(tile_idx)
+            self.stats = monitor.stats()
+        return n_rendered
+
+    def run_adaptive(self, integrator, threshold=0.05, max_spp=1024, min_spp=32, on_round=None):
+        """
+        renders in rounds of integrator.samples_per_pixel samples. Once the pixels have min_spp samples, only
+        the pixels whose relative error (see SharedFramebuffer.relative_error) is above threshold and that have
+        less than max_spp samples are rendered again, the converged pixels are not sampled anymore.
+        With fewer samples the variance estimates are too noisy to stop any pixel.
+        on_round(round_idx, active) is called after every round with the mask of the pixels still active.
+        Returns the number of rounds
+        """
+        active = np.ones((self.height, self.width), dtype=bool)
+        self.run(integrator)
+        n_rounds = 1
+
+        while True:
+            counts = self.framebuffer.counts
+            converged = (self.framebuffer.relative_error() <= threshold) & (counts >= min_spp)
+            active &= ~converged & (counts + integrator.samples_per_pixel <= max_spp)
+            if on_round is not None:
+                on_round(n_rounds, active)
+            if not active.any():
+                break
+            self.run(integrator, accumulate=True, active=active)
+            n_rounds += 1
+
+        self.stats['rounds'] = n_rounds
+        self.stats['mean_spp'] = float(self.framebuffer.counts.mean())
+        return n_rounds
+
+    def run_progressive(self, integrator, n_passes, checkpoint=None, checkpoint_interval=60., on_pass=None):
+        """
+        renders n_passes passes of integrator.samples_per_pixel samples accumulated in the framebuffer.
+
+        If checkpoint is given, the framebuffer is saved to checkpoint.npy and the render state (seed,
+        sample offset and passes done) to checkpoint.json every checkpoint_interval seconds and after the
+        last pass. When the checkpoint already exists the render resumes from it and only the missing
+        passes are rendered, with new samples. Resuming needs the same canvas, seed and samples_per_pixel,
+        otherwise an exception is raised. on_pass(pass_idx) is called after every pass.
+        Returns the number of passes rendered by this call
+        """
+        passes_done = 0
+        if checkpoint is not None and os.path.exists(checkpoint + '.json'):
+            passes_done = self._load_checkpoint(integrator, checkpoint)
+
+        last_checkpoint = time.time()
+        for pass_idx in range(passes_done, n_passes):
+            self.run(integrator, accumulate=pass_idx > 0)
+            if on_pass is not None:
+                on_pass(pass_idx)
+
+            is_last = pass_idx == n_passes - 1
+            if checkpoint is not None and (is_last or time.time() - last_checkpoint >= checkpoint_interval):
+                self._save_checkpoint(integrator, checkpoint, pass_idx + 1)
+                last_checkpoint = time.time()
+
+        return max(n_passes - passes_done, 0)
+
+    def _save_checkpoint(self, integrator, checkpoint, passes_done):
+        # the metadata is written after the buffers, so it never points to an incomplete file
+        self.framebuffer.save(checkpoint + '.npy')
+        metadata = {
+            'width': self.width,
+            'height': self.height,
+            'aovs': self.framebuffer.aovs_channels,
+            'seed': integrator.seed,
+            'sample_offset': int(self.framebuffer.counts.max()),
+            'samples_per_pixel': integrator.samples_per_pixel,
+            'passes': passes_done,
+        }
+        with open(checkpoint + '.json.tmp', 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(checkpoint + '.json.tmp', checkpoint + '.json')
+
+    def _load_checkpoint(self, integrator, checkpoint):
+        with open(checkpoint + '.json') as f:
+            metadata = json.load(f)
+        if (metadata['width'], metadata['height'], metadata['aovs']) != \
+                (self.width, self.height, self.framebuffer.aovs_channels):
+            raise Exception('checkpoint %s was rendered with a different canvas' % checkpoint)
+        if (metadata['width'], metadata['height']) != (integrator.width, integrator.height):
+            raise Exception('checkpoint %s was rendered at %dx%d, the integrator renders %dx%d' % (
+                checkpoint, metadata['width'], metadata['height'], integrator.width, integrator.height))
+        if metadata['seed'] != integrator.seed:
+            raise Exception('checkpoint %s was rendered with seed %d' % (checkpoint, metadata['seed']))
+        if metadata['samples_per_pixel'] != integrator.samples_per_pixel:
+            raise Exception('checkpoint %s was rendered with passes of %d samples per pixel' % (
+                checkpoint, metadata['samples_per_pixel']))
+
+        # the sample offset of the next pass is taken from the framebuffer counts by run(accumulate=True)
+        self.framebuffer.load(checkpoint + '.npy')
+        return metadata['passes']
+
+    def run_budget(self, integrator, seconds, on_pass=None):
+        """
+        renders passes of integrator.samples_per_pixel samples until seconds have passed. The first pass is
+        always finished, even past the budget, so every pixel has samples. The following passes are cut at the
+        deadline: the tiles in flight are finished and the rest skipped, the framebuffer normalizes every pixel
+        by its own sample count. on_pass(pass_idx, seconds) is called after every pass.
+        Sets stats with the passes, their times and the samples per pixel achieved
+        """
+        start = time.time()
+        deadline = start + seconds
+        pass_times = []
+
+        while not pass_times or time.time() < deadline:
+            pass_start = time.time()
+            self.run(integrator, accumulate=len(pass_times) > 0, deadline=deadline if pass_times else None)
+            pass_times.append(time.time() - pass_start)
+            if on_pass is not None:
+                on_pass(len(pass_times) - 1, pass_times[-1])
+
+        counts = self.framebuffer.counts
+        if counts.min() == 0:
+            raise Exception('the budget render left pixels without samples')
+        self.stats.update({
+            'elapsed': time.time() - start,
+            'passes': len(pass_times),
+            'pass_times': pass_times,
+            'spp': float(counts.mean()),
+            'min_spp': float(counts.min()),
+            'max_spp': float(counts.max()),
+        })
+        if not self.silent:
+            print('%d passes in %.1fs, %.1f samples per pixel (%d to %d)' % (
+                self.stats['passes'], self.stats['elapsed'], self.stats['spp'], self.stats['min_spp'],
+                self.stats['max_spp']))
+        return self.stats
+
+    def sample_count_image(self):
+        """
+        returns a (height, width) heatmap with the number of samples taken in every pixel
+        """
+        return self.framebuffer.counts.copy()
+
+    def close(self):
+        if self.render_pool is not None:
+            self.render_pool.close()
+            self.render_pool = None
+        if self.framebuffer is not None:
+            self.framebuffer.close()
+            self.framebuffer = None
+        if self.telemetry is not None:
+            self.telemetry.close()
+            self.telemetry = None
+
+    def tile_time_image(self):
+        """
+        returns a (height, width) image where every pixel has the time spent rendering its tile,
+        useful to see how the cost is distributed across the image
+        """
+        img = np.zeros((self.height, self.width))
+        for (col_start, row_start, col_end, row_end), seconds in zip(self.tiles, self.tile_times):
+            img[row_start:row_end, col_start:col_end] = seconds
+        return img
+
+    def worker_times(self):
+        """
+        returns a dictionary with the total time spent by every worker, to check the load balance
+        """
+        return {int(worker): float(self.tile_times[self.tile_workers == worker].sum())
+                for worker in np.unique(self.tile_workers)}
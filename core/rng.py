@@ -0,0 +1,109 @@
+"""
+Counter-based random numbers.
+
+Every random number is a hash of its key (seed, pixel, sample, dimension) instead of the next state of a
+global generator, so the value drawn at a sampling site does not depend on which process renders the
+pixel or in which order the tiles are rendered. The same key always gives the same number in the scalar
+(numba) and in the batched (NumPy) versions.
+"""
+
+import numba as nb
+import numpy as np
+
+# the hash works on 32 bit values stored in uint64, constants are typed so numba does not promote to float
+_MASK = np.uint64(0xFFFFFFFF)
+_MULTIPLIER = np.uint64(1664525)
+_INCREMENT = np.uint64(1013904223)
+_SHIFT_16 = np.uint64(16)
+_SHIFT_11 = np.uint64(11)
+_SHIFT_21 = np.uint64(21)
+_TO_UNIT = 2. ** -53
+
+
+@nb.jit(nopython=True)
+def pcg4d(x, y, z, w):
+    """
+    PCG4D hash (Jarzynski and Olano, 2020) of four 32 bit values given as uint64.
+    The same code runs on NumPy uint64 arrays through pcg4d.py_func
+    """
+    x = (x * _MULTIPLIER + _INCREMENT) & _MASK
+    y = (y * _MULTIPLIER + _INCREMENT) & _MASK
+    z = (z * _MULTIPLIER + _INCREMENT) & _MASK
+    w = (w * _MULTIPLIER + _INCREMENT) & _MASK
+
+    x = (x + y * w) & _MASK
+    y = (y + z * x) & _MASK
+    z = (z + x * y) & _MASK
+    w = (w + y * z) & _MASK
+
+    x = x ^ (x >> _SHIFT_16)
+    y = y ^ (y >> _SHIFT_16)
+    z = z ^ (z >> _SHIFT_16)
+    w = w ^ (w >> _SHIFT_16)
+
+    x = (x + y * w) & _MASK
+    y = (y + z * x) & _MASK
+    z = (z + x * y) & _MASK
+    w = (w + y * z) & _MASK
+    return x, y, z, w
+
+
+@nb.jit(nopython=True)
+def random_uniform(seed, pixel, sample, dim):
+    """
+    uniform number in [0, 1) for the key (seed, pixel, sample, dim), made of 53 bits of the hash
+    """
+    x, y, _, _ = pcg4d(np.uint64(seed) & _MASK, np.uint64(pixel) & _MASK,
+                       np.uint64(sample) & _MASK, np.uint64(dim) & _MASK)
+    return ((x << _SHIFT_21) | (y >> _SHIFT_11)) * _TO_UNIT
+
+
+def hash_batch(x, y, z, w):
+    """
+    pcg4d of integer keys that are broadcast together, returns four uint64 arrays with 32 bit values
+    """
+    keys = np.broadcast_arrays(*[np.asarray(key).astype(np.uint64) & _MASK for key in (x, y, z, w)])
+    return pcg4d.py_func(*keys)
+
+
+def random_uniform_batch(seed, pixels, samples, dims):
+    """
+    batched version of random_uniform, the keys are broadcast together and the result has their shape
+    """
+    x, y, _, _ = hash_batch(seed, pixels, samples, dims)
+    return ((x << _SHIFT_21) | (y >> _SHIFT_11)) * _TO_UNIT
+
+
+spec = [
+    ('seed', nb.int64),
+    ('pixel', nb.int64),
+    ('sample', nb.int64),
+    ('dim', nb.int64),
+    ('values', nb.float64[:]),
+]
+
+
+@nb.jitclass(spec)
+class RandomStream(object):
+    """
+    Random numbers of a single sample of a pixel. Every call to next() returns the number of the next
+    dimension, so the sampling sites of a path draw from the stream in the order they are evaluated.
+
+    values holds precomputed numbers for the first dimensions (for example the camera samples given by
+    a Sampler), the following dimensions are hashed.
+    """
+
+    def __init__(self, seed, pixel, sample, dim, values):
+        self.seed = seed
+        self.pixel = pixel
+        self.sample = sample
+        self.dim = dim
+        self.values = values
+
+    def next(self):
+        if self.dim < self.values.shape[0]:
+            value = self.values[self.dim]
+        else:
+            value = random_uniform(self.seed, self.pixel, self.sample, self.dim)
+        self.dim += 1
+        return value
@@ -2,47 +2,16 @@ import math
 from bisect import bisect_left
 from functools import reduce
 
+import numba as nb
 import numpy as np
 
-uniform = np.random.uniform
+from .rng import hash_batch, random_uniform_batch
 
 """
 utility functions
 """
 
 
-def print_discrepancy(discrepancy, title):
-    print('%s\t%.4f\t%.4f\t%.4f' % (title, discrepancy.mean(), discrepancy.std(), discrepancy.max()))
-
-
-def plotter(samples, title, grid=None):
-    from matplotlib import pyplot as plt
-
-    if grid is not None:
-        grid_i = grid[0]
-        grid_j = grid[1]
-        all_axis = np.zeros(samples.shape)
-        all_axis[:, 1] = 1
-
-    plt.scatter(samples[:, 0], samples[:, 1])
-    plt.title(title)
-    axes = plt.gca()
-    axes.set_xlim([-0.1, 1.1])
-    axes.set_ylim([-0.1, 1.1])
-    axes.set_aspect('equal')
-    if grid is not None:
-        for idx in range(len(grid_i)):
-            plt.plot([grid_i[idx], grid_i[idx]], all_axis[idx], alpha=0.2, color='b', dashes=[6, 2])
-        for idx in range(len(grid_j)):
-            plt.plot(all_axis[idx], [grid_j[idx], grid_j[idx]], alpha=0.2, color='b', dashes=[6, 2])
-
-        # add grid lines of the last elements of the square
-        plt.plot([all_axis[1], all_axis[1]], all_axis[idx], alpha=0.2, color='b', dashes=[6, 2])
-        plt.plot(all_axis[idx], [all_axis[1], all_axis[1]], alpha=0.2, color='b', dashes=[6, 2])
-
-    plt.show()
-
-
 def get_factors(n):
     # get factors and make it a set to remove duplicates
     # then make it a lit to sort in in increasing order
@@ -91,22 +60,77 @@ sampling functions
 """
 
 
+# 2D dimensions of a camera path given by a sampler, the time dimension only uses the first value and
+# every bounce takes the BOUNCE_DIMENSIONS dimensions from FIRST_BOUNCE_DIMENSION + BOUNCE_DIMENSIONS * depth.
+# The 2D dimension d holds the numbers 2 * d and 2 * d + 1 of the RandomStream of the path
+PIXEL_DIMENSION, LENS_DIMENSION, TIME_DIMENSION, FIRST_BOUNCE_DIMENSION = range(4)
+BOUNCE_DIMENSIONS = 4
+
+# numbers of a bounce, relative to its first one: the scatter takes up to three numbers, then the Russian
+# roulette number and the three numbers of the light sample
+SCATTER_NUMBER, ROULETTE_NUMBER, LIGHT_NUMBER = 0, 3, 4
+
+
+@nb.jit(nopython=True)
+def bounce_number(depth, offset=0):
+    # dimension of the RandomStream of the number offset of the bounce at depth
+    return 2 * (FIRST_BOUNCE_DIMENSION + BOUNCE_DIMENSIONS * depth) + offset
+
+
 class Sampler(object):
+    """
+    Calling a sampler returns a pattern of N samples in the unit square drawn with self.random, subclasses
+    implement pattern(random), which draws it with the given generator.
+
+    Samplers are also the sample source of the integrators: samples(seed, pixel_ids, sample_indices, dimension)
+    returns the 2D sample of every (pixel, sample index) for one dimension of the path. The keys are broadcast
+    together, so the samples of a whole tile come as a single array.
+
+    By default the pattern is drawn again for every pixel, dimension and block of N samples with a generator
+    keyed by (seed, pixel, dimension, block), given to pattern, and randomly permuted, so the dimensions of a
+    path are not correlated and the samples do not depend on the order the pixels are rendered.
+    """
+
     def __init__(self, N, dim=2):
         self.N = N
         self.dim = dim
+        self.random = np.random  # source of the patterns, the np.random module or a np.random.Generator
 
     def __call__(self, get_grid=False):
+        return self.pattern(self.random, get_grid)
+
+    def pattern(self, random, get_grid=False):
+        # pattern of N samples drawn with random, the np.random module or a np.random.Generator
         raise NotImplementedError()
 
+    def samples(self, seed, pixel_ids, sample_indices, dimension):
+        pixel_ids, sample_indices = np.broadcast_arrays(np.asarray(pixel_ids), np.asarray(sample_indices))
+        keys = np.stack([pixel_ids.ravel(), sample_indices.ravel() // self.N], axis=1)
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+
+        # one permuted pattern for every (pixel, block)
+        patterns = np.zeros((unique_keys.shape[0], self.N, 2))
+        for key_idx, (pixel, block) in enumerate(unique_keys):
+            random = np.random.default_rng([seed, pixel, dimension, block])
+            pattern = self.pattern(random)[:, :2]
+            patterns[key_idx] = pattern[random.permutation(self.N)]
+
+        values = patterns[inverse.ravel(), sample_indices.ravel() % self.N]
+        return values.reshape((*pixel_ids.shape, 2))
+
 
 class RandomSampling(Sampler):
-    def __call__(self, get_grid=False):
-        return uniform(0, 1, (self.N, self.dim))
+    def pattern(self, random, get_grid=False):
+        return random.uniform(0, 1, (self.N, self.dim))
+
+    def samples(self, seed, pixel_ids, sample_indices, dimension):
+        # independent numbers, the same ones a RandomStream draws for the dimensions 2 * dimension and the next
+        return random_uniform_batch(seed, np.asarray(pixel_ids)[..., None], np.asarray(sample_indices)[..., None],
+                                    2 * dimension + np.arange(2))
 
 
 class RegularSampling(Sampler):
-    def __call__(self, get_grid=False):
+    def pattern(self, random, get_grid=False):
         samples = np.zeros((self.N, self.dim))
 
         if self.dim == 2:
@@ -132,7 +156,7 @@ class RegularSampling(Sampler):
 
 
 class JitteredSampling(Sampler):
-    def __call__(self, get_grid=False):
+    def pattern(self, random, get_grid=False):
         samples = np.zeros((self.N, self.dim))
 
         if self.dim == 2:
@@ -150,8 +174,8 @@ class JitteredSampling(Sampler):
             j, i = j.flatten(), i.flatten()
 
             # get samples
-            samples[:, 0] = uniform(i / nx, (i + 1) / nx)
-            samples[:, 1] = uniform(j / ny, (j + 1) / ny)
+            samples[:, 0] = random.uniform(i / nx, (i + 1) / nx)
+            samples[:, 1] = random.uniform(j / ny, (j + 1) / ny)
 
         if get_grid:
             return samples, [grid_i, grid_j]
@@ -159,7 +183,7 @@ class JitteredSampling(Sampler):
 
 
 class HalfJitteredSampling(Sampler):
-    def __call__(self, get_grid=False):
+    def pattern(self, random, get_grid=False):
         samples = np.zeros((self.N, self.dim))
 
         if self.dim == 2:
@@ -177,8 +201,8 @@ class HalfJitteredSampling(Sampler):
             j, i = j.flatten(), i.flatten()
 
             # get samples
-            samples[:, 0] = uniform((i + 0.25) / nx, (i + 0.75) / nx)
-            samples[:, 1] = uniform((j + 0.25) / ny, (j + 0.75) / ny)
+            samples[:, 0] = random.uniform((i + 0.25) / nx, (i + 0.75) / nx)
+            samples[:, 1] = random.uniform((j + 0.25) / ny, (j + 0.75) / ny)
 
         if get_grid:
             return samples, [grid_i, grid_j]
@@ -186,45 +210,167 @@ class HalfJitteredSampling(Sampler):
 
 
 class PoissonDiskSampling(Sampler):
-    def __init__(self, d, *args, **kwargs):
+    """
+    N samples at a minimum distance d from each other, generated with Bridson's algorithm (see poisson_disk).
+    If d is None it is chosen to fit N samples.
+
+    If tileable, n_patterns toroidal patterns are generated once per seed in every process (they are cached at
+    module level, so they are not rebuilt for every tile or pickled sampler) and samples() reuses them for
+    all the pixels: every pixel, dimension and block of N samples takes one of them, permuted and moved by
+    a random toroidal shift, which keeps the minimum distance.
+    """
+
+    def __init__(self, d=None, *args, tileable=False, n_patterns=16, **kwargs):
         self.d = d
+        self.tileable = tileable
+        self.n_patterns = n_patterns
         super(PoissonDiskSampling, self).__init__(*args, **kwargs)
 
-    def __call__(self, get_grid=False):
-        def get_mask(samples):
-            j, i = np.meshgrid(range(self.N), range(self.N))
-            j, i = j.flatten(), i.flatten()
+    def pattern(self, random, get_grid=False):
+        return poisson_disk(random, radius=self.d, n=self.N, toroidal=self.tileable)
 
-            dist = ((samples[i, 0] - samples[j, 0]) ** 2 + (samples[i, 1] - samples[j, 1]) ** 2).reshape(
-                (self.N, self.N))
+    def samples(self, seed, pixel_ids, sample_indices, dimension):
+        if not self.tileable:
+            return super(PoissonDiskSampling, self).samples(seed, pixel_ids, sample_indices, dimension)
 
-            upper_diag_idx = np.triu_indices(self.N)
-            dist[upper_diag_idx] = float('inf')
-            mask = np.any(dist < self.d ** 2, axis=1)
-            return mask
+        tileable_patterns = _tileable_patterns(seed, self.N, self.d, self.n_patterns)
+        pixel_ids, sample_indices = np.broadcast_arrays(np.asarray(pixel_ids), np.asarray(sample_indices))
+        keys = np.stack([pixel_ids.ravel(), sample_indices.ravel() // self.N], axis=1)
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
 
-        samples = uniform(0, 1, (self.N, self.dim))
-        mask = get_mask(samples)
+        # order of the samples, pattern and shift of every (pixel, block)
+        order_keys, pattern_keys, x_keys, y_keys = hash_batch(seed, unique_keys[:, :1], dimension,
+                                                              unique_keys[:, 1:] * self.N + np.arange(self.N))
+        orders = np.argsort(order_keys, axis=1)
+        patterns = pattern_keys[:, 0] % np.uint64(self.n_patterns)
+        shifts = np.stack([x_keys[:, 0], y_keys[:, 0]], axis=1) * 2. ** -32
 
-        while np.any(mask):
-            samples[mask] = uniform(0, 1, (self.N, self.dim))[mask]
-            mask = get_mask(samples)
+        values = tileable_patterns[patterns[inverse], orders[inverse, sample_indices.ravel() % self.N]]
+        values = values + shifts[inverse]
+        return (values % 1.).reshape((*pixel_ids.shape, 2))
 
-        return samples
+
+_TILEABLE_PATTERNS = {}  # (seed, N, d, n_patterns) -> patterns, shared by the samplers and tiles of a process
+_MAX_TILEABLE_PATTERNS = 8
+
+
+def _tileable_patterns(seed, n, radius, n_patterns):
+    # the n_patterns toroidal patterns of a seed, they are only generated once in every worker
+    key = (seed, n, radius, n_patterns)
+    if key not in _TILEABLE_PATTERNS:
+        if len(_TILEABLE_PATTERNS) >= _MAX_TILEABLE_PATTERNS:
+            del _TILEABLE_PATTERNS[next(iter(_TILEABLE_PATTERNS))]
+        random = np.random.default_rng([seed])
+        _TILEABLE_PATTERNS[key] = np.stack([poisson_disk(random, radius, n, toroidal=True) for _ in range(n_patterns)])
+    return _TILEABLE_PATTERNS[key]
+
+
+def poisson_disk(random, radius=None, n=None, k=30, toroidal=False, max_tries=10):
+    """
+    Poisson disk samples in the unit square with Bridson's algorithm, random is np.random or a np.random.Generator.
+
+        - radius: only returns the samples of a maximal set with that minimum distance
+        - n: returns n samples with the largest minimum distance found for them
+        - radius and n: returns n samples with that minimum distance, the maximal sets are generated
+          max_tries times before giving up
+
+    When there are more samples than needed a random subset is kept, it keeps the minimum distance.
+    With toroidal the distances wrap around the borders, so the pattern can be tiled and shifted.
+    """
+    if radius is None and n is None:
+        raise Exception('poisson_disk needs a radius or a number of samples')
+
+    if n is None:
+        return _bridson(random, radius, k, toroidal)
+
+    # maximal sets have about 0.65 / radius ** 2 samples, the radius is reduced until n samples fit
+    fixed_radius = radius is not None
+    radius = radius if fixed_radius else math.sqrt(0.65 / n)
+    for _ in range(max_tries):
+        samples = _bridson(random, radius, k, toroidal)
+        if len(samples) >= n:
+            return samples[random.permutation(len(samples))[:n]]
+        if not fixed_radius:
+            radius *= 0.98 * math.sqrt(len(samples) / n)
+
+    raise Exception('%d poisson disk samples do not fit at a distance %f' % (n, radius))
+
+
+def _bridson(random, radius, k, toroidal):
+    """
+    Bridson's algorithm: a background grid with cells of side below radius / sqrt(2) holds at most one sample
+    per cell, so every candidate is only checked against the samples of the nearby cells. New samples are
+    drawn around a random active sample in the annulus [radius, 2 radius] and a sample stops being active
+    after k failed candidates. Runs in time linear in the number of samples
+    """
+    n_cells = int(math.ceil(math.sqrt(2.) / radius))
+    reach = int(math.ceil(radius * n_cells))  # cells to check on every side
+    offsets_i, offsets_j = np.meshgrid(np.arange(-reach, reach + 1), np.arange(-reach, reach + 1))
+    offsets_i, offsets_j = offsets_i.ravel(), offsets_j.ravel()
+
+    grid = -np.ones((n_cells, n_cells), dtype=np.int64)  # index of the sample in every cell, -1 if empty
+    samples = np.zeros((n_cells * n_cells, 2))
+
+    def add(sample, n_samples):
+        samples[n_samples] = sample
+        grid[int(sample[0] * n_cells), int(sample[1] * n_cells)] = n_samples
+
+    add(random.uniform(0, 1, 2), 0)
+    active, n_samples = [0], 1
+
+    while active:
+        active_idx = min(int(random.uniform(0, len(active))), len(active) - 1)
+        center = samples[active[active_idx]]
+
+        # k candidates uniform in the area of the annulus
+        distances = radius * np.sqrt(random.uniform(1, 4, k))
+        angles = random.uniform(0, 2 * math.pi, k)
+        candidates = center + distances[:, None] * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        if toroidal:
+            candidates %= 1.
+        else:
+            candidates = candidates[np.all((candidates >= 0.) & (candidates < 1.), axis=1)]
+        candidates = np.minimum(candidates, np.nextafter(1., 0.))
+
+        # samples in the cells around every candidate
+        cells_i = (candidates[:, 0] * n_cells).astype(np.int64)[:, None] + offsets_i
+        cells_j = (candidates[:, 1] * n_cells).astype(np.int64)[:, None] + offsets_j
+        if toroidal:
+            neighbors = grid[cells_i % n_cells, cells_j % n_cells]
+        else:
+            inside = (cells_i >= 0) & (cells_i < n_cells) & (cells_j >= 0) & (cells_j < n_cells)
+            neighbors = np.where(inside, grid[np.clip(cells_i, 0, n_cells - 1), np.clip(cells_j, 0, n_cells - 1)], -1)
+
+        deltas = candidates[:, None, :] - samples[np.maximum(neighbors, 0)]
+        if toroidal:
+            deltas -= np.round(deltas)
+        far = (neighbors < 0) | (np.sum(deltas ** 2, axis=2) >= radius ** 2)
+        accepted = np.flatnonzero(np.all(far, axis=1))
+
+        if accepted.shape[0] > 0:
+            add(candidates[accepted[0]], n_samples)
+            active.append(n_samples)
+            n_samples += 1
+        else:  # remove the sample from the active list
+            active[active_idx] = active[-1]
+            active.pop()
+
+    return samples[:n_samples].copy()
 
 
 class NRooksSampling(Sampler):
-    def __call__(self, get_grid=False):
+    def pattern(self, random, get_grid=False):
         samples = np.zeros((self.N, self.dim))
         i = np.arange(0, self.N)
-        samples_x = uniform(i / self.N, (i + 1) / self.N)
-        samples_y = uniform(i / self.N, (i + 1) / self.N)
+        samples_x = random.uniform(i / self.N, (i + 1) / self.N)
+        samples_y = random.uniform(i / self.N, (i + 1) / self.N)
 
         # get grid values
         grid_i = grid_j = i / self.N
 
         # randomly shuffle samples over X
-        np.random.shuffle(samples_x)
+        random.shuffle(samples_x)
         samples[:, 0] = samples_x
         samples[:, 1] = samples_y
 
@@ -233,6 +379,96 @@ class NRooksSampling(Sampler):
         return samples
 
 
+_MASK = np.uint64(0xFFFFFFFF)
+_SOBOL_DIRECTIONS = [np.uint64(0x80000000)]
+for _ in range(31):
+    _SOBOL_DIRECTIONS.append(_SOBOL_DIRECTIONS[-1] ^ (_SOBOL_DIRECTIONS[-1] >> np.uint64(1)))
+
+
+def _reverse_bits(x):
+    # reverse the 32 bits of the values of a uint64 array
+    for shift, mask in ((1, 0x55555555), (2, 0x33333333), (4, 0x0F0F0F0F), (8, 0x00FF00FF), (16, 0x0000FFFF)):
+        shift, mask = np.uint64(shift), np.uint64(mask)
+        x = ((x >> shift) & mask) | ((x & mask) << shift)
+    return x
+
+
+def _nested_uniform_scramble(x, seed):
+    """
+    Owen scrambling of 32 bit values with the Laine-Karras hash (Burley, 2020). The hash only mixes the low
+    bits into the high ones, so it is applied to the reversed bits
+    """
+    x = _reverse_bits(x)
+    x = (x + seed) & _MASK
+    for constant in (0x6c50b47c, 0xb82f1e52, 0xc7afe638, 0x8d22f6e6):
+        x = x ^ ((x * np.uint64(constant)) & _MASK)
+    return _reverse_bits(x)
+
+
+class SobolSampling(Sampler):
+    """
+    2D Sobol sequence (van der Corput and the second Sobol dimension) with hash based Owen scrambling and
+    shuffled sample indices (Burley, 2020), different for every pixel and dimension. The first N samples
+    are stratified in all the elementary intervals when N is a power of two.
+    """
+
+    def pattern(self, random, get_grid=False):
+        return self.samples(int(random.uniform(0, 2 ** 32)), 0, np.arange(self.N), 0)
+
+    def samples(self, seed, pixel_ids, sample_indices, dimension):
+        pixel_ids, sample_indices = np.broadcast_arrays(np.asarray(pixel_ids), np.asarray(sample_indices))
+        index_seeds, x_seeds, y_seeds, _ = hash_batch(seed, pixel_ids, dimension, 0)
+
+        index = _nested_uniform_scramble(sample_indices.astype(np.uint64) & _MASK, index_seeds)
+
+        x = _reverse_bits(index)
+        y = np.zeros_like(index)
+        for bit, direction in enumerate(_SOBOL_DIRECTIONS):
+            y ^= ((index >> np.uint64(bit)) & np.uint64(1)) * direction
+
+        x = _nested_uniform_scramble(x, x_seeds)
+        y = _nested_uniform_scramble(y, y_seeds)
+        return np.stack([x, y], axis=-1) * 2. ** -32
+
+
+_PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61, 67, 71, 73, 79, 83, 89, 97, 101, 103,
+           107, 109, 113, 127, 131]
+
+
+def radical_inverse(indices, base):
+    # mirrors the digits of the indices in the given base around the decimal point
+    indices = np.array(indices, dtype=np.int64)
+    result = np.zeros(indices.shape)
+    scale = 1. / base
+    while np.any(indices > 0):
+        result += (indices % base) * scale
+        indices //= base
+        scale /= base
+    return result
+
+
+class HaltonSampling(Sampler):
+    """
+    Halton sequence, the dimension d uses the prime bases _PRIMES[2 * d] and _PRIMES[2 * d + 1].
+    Every pixel and dimension is scrambled with a random toroidal shift (Cranley-Patterson rotation).
+    Dimensions past the table of primes fall back to independent random numbers.
+    """
+
+    def pattern(self, random, get_grid=False):
+        return self.samples(int(random.uniform(0, 2 ** 32)), 0, np.arange(self.N), 0)
+
+    def samples(self, seed, pixel_ids, sample_indices, dimension):
+        if 2 * dimension + 1 >= len(_PRIMES):
+            return RandomSampling.samples(self, seed, pixel_ids, sample_indices, dimension)
+
+        pixel_ids, sample_indices = np.broadcast_arrays(np.asarray(pixel_ids), np.asarray(sample_indices))
+        x_shifts, y_shifts, _, _ = hash_batch(seed, pixel_ids, dimension, 0)
+
+        x = radical_inverse(sample_indices, _PRIMES[2 * dimension]) + x_shifts * 2. ** -32
+        y = radical_inverse(sample_indices, _PRIMES[2 * dimension + 1]) + y_shifts * 2. ** -32
+        return np.stack([x % 1., y % 1.], axis=-1)
+
+
 """
 Discrepancy measures
 
@@ -270,14 +506,7 @@ def zeremba_discrepancy(sampling, iters):
 
     for i in range(iters):
         samples = sampling()  # call sampling method to obtain samples
-        samples_i, samples_j = samples[:, 0], samples[:, 1]
-        discrepancy_i = np.zeros(len(samples))
-        for idx in range(len(samples)):
-            a, b = samples[idx]  # get point (a,b)
-            n = np.sum((samples_i < a) & (samples_j < b))  # find all the points inside the small square formed by (a,b)
-            discrepancy_i[idx] = np.abs(n / len(samples) - a * b)  # get the discrepancy value
-
-        discrepancy[i] = discrepancy_i.max()
+        discrepancy[i] = _zeremba_values(samples).max()
     return discrepancy
 
 
@@ -295,87 +524,94 @@ def zeremba_rms_discrepancy(sampling, iters):
 
     for i in range(iters):
         samples = sampling()  # call sampling method to obtain samples
-        samples_i, samples_j = samples[:, 0], samples[:, 1]
-        discrepancy_i = np.zeros(len(samples))
-        for idx in range(len(samples)):
-            a, b = samples[idx]  # get point (a,b)
-            n = np.sum((samples_i < a) & (samples_j < b))  # find all the points inside the small square formed by (a,b)
-            discrepancy_i[idx] = np.abs(n / len(samples) - a * b)  # get the discrepancy value
-
-        discrepancy[i] = np.sqrt((discrepancy_i ** 2).mean())
+        discrepancy[i] = np.sqrt((_zeremba_values(samples) ** 2).mean())
     return discrepancy
 
 
 def strout_discrepancy(sampling, iters):
+    """
+    Maximum of |n/N - (a - c)(b - d)| over the pairs of samples (a,b), (c,d), where n is the number of
+    samples strictly inside the box between both corners. Each box is counted in O(1) from a table of
+    prefix counts, so a set of N samples costs O(N^2)
+    """
     discrepancy = np.zeros(iters)
 
     for i in range(iters):
         samples = sampling()  # call sampling method to obtain samples
-        samples_i, samples_j = samples[:, 0], samples[:, 1]
-        discrepancy_i = []
-        for idx_ab in range(len(samples)):
-            a, b = samples[idx_ab]  # get point (a,b)
-            for idx_cd in range(idx_ab, len(samples)):
-                c, d = samples[idx_cd]  # get point (c,d)
-
-                # find all the points inside the small square formed by (a,b), (c,d)
-                n = np.sum((samples_i < a) & (samples_j < b) & (samples_i > c) & (samples_j > d))
-                discrepancy_i.append(np.abs(n / len(samples) - (a - c) * (b - d)))  # get the discrepancy value
-
-        discrepancy[i] = np.array(discrepancy_i).max()
-        # discrepancy[i] = np.sqrt((discrepancy_i ** 2).mean())
+        discrepancy[i] = _strout_max(samples[:, 0].copy(), samples[:, 1].copy())
     return discrepancy
 
 
-"""
-Test of the sampling functions
-"""
-N = 16
-
-rnd = RandomSampling(N=N)
-reg = RegularSampling(N=N)
-jit = JitteredSampling(N=N)
-hjit = HalfJitteredSampling(N=N)
-poisson = PoissonDiskSampling(N=N, d=0.2)
-nrooks = NRooksSampling(N=N)
-
-rnd_samples = rnd()
-reg_samples, reg_grid = reg(get_grid=True)
-jit_samples, jit_grid = jit(get_grid=True)
-hjit_samples, hjit_grid = hjit(get_grid=True)
-poisson_samples = poisson()
-nrooks_samples, nrooks_grid = nrooks(get_grid=True)
-
-plotter(rnd_samples, 'random sampling')
-plotter(reg_samples, 'regular sampling', grid=reg_grid)
-plotter(jit_samples, 'jitered sampling', grid=jit_grid)
-plotter(hjit_samples, 'half-jitered sampling', grid=hjit_grid)
-plotter(poisson_samples, 'poisson disk sampling')
-plotter(nrooks_samples, 'n-rooks sampling', grid=nrooks_grid)
-
-iters = 100
-print_discrepancy(zeremba_discrepancy(rnd, iters), 'Zeremba disc. random sampling:')
-print_discrepancy(zeremba_discrepancy(reg, iters), 'Zeremba disc. regular sampling:')
-print_discrepancy(zeremba_discrepancy(jit, iters), 'Zeremba disc. jittered sampling:')
-print_discrepancy(zeremba_discrepancy(hjit, iters), 'Zeremba disc. half-jittered sampling:')
-print_discrepancy(zeremba_discrepancy(poisson, iters), 'Zeremba disc. poisson sampling:')
-print_discrepancy(zeremba_discrepancy(nrooks, iters), 'Zeremba disc. n-rooks sampling:')
-print()
-
-iters = 100
-print_discrepancy(zeremba_rms_discrepancy(rnd, iters), 'Zeremba RMS disc. random sampling:')
-print_discrepancy(zeremba_rms_discrepancy(reg, iters), 'Zeremba RMS disc. regular sampling:')
-print_discrepancy(zeremba_rms_discrepancy(jit, iters), 'Zeremba RMS disc. jittered sampling:')
-print_discrepancy(zeremba_rms_discrepancy(hjit, iters), 'Zeremba RMS disc. half-jittered sampling:')
-print_discrepancy(zeremba_rms_discrepancy(poisson, iters), 'Zeremba RMS disc. poisson sampling:')
-print_discrepancy(zeremba_rms_discrepancy(nrooks, iters), 'Zeremba RMS disc. n-rooks sampling:')
-print()
-
-iters = 100
-print_discrepancy(strout_discrepancy(rnd, iters), 'Strout disc. random sampling:')
-print_discrepancy(strout_discrepancy(reg, iters), 'Strout disc. regular sampling:')
-print_discrepancy(strout_discrepancy(jit, iters), 'Strout disc. jittered sampling:')
-print_discrepancy(strout_discrepancy(hjit, iters), 'Strout disc. half-jittered sampling:')
-print_discrepancy(strout_discrepancy(poisson, iters), 'Strout disc. poisson sampling:')
-print_discrepancy(strout_discrepancy(nrooks, iters), 'Strout disc. n-rooks sampling:')
-print()
+def _zeremba_values(samples):
+    # |n/N - ab| for every sample (a,b)
+    samples_i, samples_j = samples[:, 0].copy(), samples[:, 1].copy()
+    n = _count_lower_left(samples_i, samples_j)
+    return np.abs(n / len(samples) - samples_i * samples_j)
+
+
+@nb.jit(nopython=True)
+def _count_lower_left(samples_i, samples_j):
+    """
+    for every sample (a,b) counts the samples with i < a and j < b in O(N log N): the samples are added in
+    increasing i to a Fenwick tree over the ranks of j, the samples with the same i are counted before
+    they are added
+    """
+    n = samples_i.shape[0]
+    order = np.argsort(samples_i)
+    ranks_j = np.searchsorted(np.sort(samples_j), samples_j)  # number of samples with a smaller j
+    tree = np.zeros(n + 1, dtype=np.int64)
+    counts = np.zeros(n, dtype=np.int64)
+
+    start = 0
+    while start < n:
+        end = start
+        while end < n and samples_i[order[end]] == samples_i[order[start]]:
+            end += 1
+
+        for k in range(start, end):
+            idx = order[k]
+            rank = ranks_j[idx]
+            while rank > 0:
+                counts[idx] += tree[rank]
+                rank -= rank & -rank
+
+        for k in range(start, end):
+            rank = ranks_j[order[k]] + 1
+            while rank <= n:
+                tree[rank] += 1
+                rank += rank & -rank
+        start = end
+    return counts
+
+
+@nb.jit(nopython=True)
+def _strout_max(samples_i, samples_j):
+    n = samples_i.shape[0]
+    sorted_i, sorted_j = np.sort(samples_i), np.sort(samples_j)
+
+    # number of samples with a smaller (below) or smaller or equal (below_eq) coordinate
+    below_i, below_eq_i = np.searchsorted(sorted_i, samples_i), np.searchsorted(sorted_i, samples_i, side='right')
+    below_j, below_eq_j = np.searchsorted(sorted_j, samples_j), np.searchsorted(sorted_j, samples_j, side='right')
+
+    # table[x, y] is the number of samples with less than x samples before them in i and y in j
+    table = np.zeros((n + 1, n + 1), dtype=np.int32)
+    positions_i, positions_j = np.argsort(np.argsort(samples_i)), np.argsort(np.argsort(samples_j))
+    for idx in range(n):
+        table[positions_i[idx] + 1, positions_j[idx] + 1] += 1
+    for x in range(1, n + 1):
+        for y in range(1, n + 1):
+            table[x, y] += table[x - 1, y] + table[x, y - 1] - table[x - 1, y - 1]
+
+    discrepancy = 0.
+    for idx_ab in range(n):
+        a, b = samples_i[idx_ab], samples_j[idx_ab]
+        for idx_cd in range(idx_ab, n):
+            c, d = samples_i[idx_cd], samples_j[idx_cd]
+
+            # samples with c < i < a and d < j < b, empty if a <= c or b <= d
+            low_i, low_j = below_eq_i[idx_cd], below_eq_j[idx_cd]
+            high_i, high_j = max(below_i[idx_ab], low_i), max(below_j[idx_ab], low_j)
+            count = table[high_i, high_j] - table[low_i, high_j] - table[high_i, low_j] + table[low_i, low_j]
+
+            discrepancy = max(discrepancy, abs(count / n - (a - c) * (b - d)))
+    return discrepancy
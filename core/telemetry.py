@@ -0,0 +1,146 @@
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# columns of the telemetry counters
+PIXELS, SAMPLES, RAYS, SECONDS = range(4)
+
+
+class Telemetry(object):
+    """
+    Render counters stored in shared memory, one row per tile with the pixels finished, samples
+    taken, rays traced and seconds spent.
+
+    A tile is rendered by a single worker, so the workers update their rows without locks and the
+    parent can read the totals at any time.
+    """
+
+    def __init__(self, n_tiles, name=None):
+        self.n_tiles = n_tiles
+        size = max(n_tiles, 1) * 4 * np.dtype(np.float64).itemsize
+
+        self.is_owner = name is None
+        if self.is_owner:
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+
+        self.counters = np.ndarray((n_tiles, 4), dtype=np.float64, buffer=self.shared_memory.buf)
+        if self.is_owner:
+            self.clear()
+
+    @classmethod
+    def attach(cls, descriptor):
+        name, n_tiles = descriptor
+        return cls(n_tiles, name=name)
+
+    @property
+    def descriptor(self):
+        return self.shared_memory.name, self.n_tiles
+
+    def clear(self):
+        self.counters[:] = 0.
+
+    def reporter(self, tile_idx, flush_every=64):
+        return TileReporter(self.counters[tile_idx], flush_every)
+
+    def totals(self):
+        # (pixels, samples, rays) finished over all the tiles
+        totals = self.counters.sum(axis=0)
+        return float(totals[PIXELS]), float(totals[SAMPLES]), float(totals[RAYS])
+
+    def close(self):
+        self.counters = None
+        self.shared_memory.close()
+        if self.is_owner:
+            self.shared_memory.unlink()
+
+
+class TileReporter(object):
+    """
+    Accumulates the counters of a tile locally and writes them to the shared row in batches of
+    flush_every pixels, so the render loop does not touch shared memory for every pixel.
+    """
+
+    def __init__(self, row, flush_every=64):
+        self.row = row
+        self.flush_every = flush_every
+        self.pixels = self.samples = self.rays = 0
+        self.start = time.time()
+
+    def update(self, pixels=1, samples=0, rays=0):
+        self.pixels += pixels
+        self.samples += samples
+        self.rays += rays
+        if self.pixels >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        self.row[PIXELS] += self.pixels
+        self.row[SAMPLES] += self.samples
+        self.row[RAYS] += self.rays
+        self.row[SECONDS] = time.time() - self.start
+        self.pixels = self.samples = self.rays = 0
+
+
+class ProgressMonitor(object):
+    """
+    Thread in the parent process that periodically aggregates the telemetry counters and reports
+    the progress, the ETA and the rays/sec. Nothing is printed if silent is True.
+    """
+
+    def __init__(self, telemetry, total_pixels, interval=0.5, silent=False, out=sys.stderr):
+        self.telemetry = telemetry
+        self.total_pixels = total_pixels
+        self.interval = interval
+        self.silent = silent
+        self.out = out
+        self.start = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def stats(self):
+        """
+        returns a dictionary with the current progress, elapsed time, ETA, samples and rays per second and
+        the average path length (rays per sample)
+        """
+        pixels, samples, rays = self.telemetry.totals()
+        elapsed = time.time() - self.start if self.start is not None else 0.
+        done = min(pixels / self.total_pixels, 1.) if self.total_pixels else 1.
+        return {
+            'progress': done,
+            'elapsed': elapsed,
+            'eta': elapsed * (1. - done) / done if done > 0 else float('inf'),
+            'samples': samples,
+            'rays': rays,
+            'samples_per_sec': samples / elapsed if elapsed > 0 else 0.,
+            'rays_per_sec': rays / elapsed if elapsed > 0 else 0.,
+            'path_length': rays / samples if samples > 0 else 0.,
+        }
+
+    def report(self, end='\r'):
+        stats = self.stats()
+        self.out.write('%5.1f%% | %6.1fs elapsed | ETA %6.1fs | %.3g samples/s | %.3g rays/s%s' % (
+            100 * stats['progress'], stats['elapsed'], stats['eta'], stats['samples_per_sec'],
+            stats['rays_per_sec'], end))
+        self.out.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def __enter__(self):
+        self.start = time.time()
+        if not self.silent:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.report(end='\n')
@@ -1,42 +1,91 @@
-import random
+"""
+Vector helpers. The sampling functions map uniform numbers to points analytically, without rejection, so every
+sample uses a fixed number of random numbers. Every scalar function f working on 3-vectors (or on k uniform
+numbers) has a f_batch version working on (N, 3) arrays (or (N, k) arrays of uniform numbers) with the same
+mapping. random_in_unit_sphere and random_in_unit_disk draw the numbers of uniform_in_sphere and concentric_disk
+from a RandomStream.
+"""
 
 import numba as nb
 import numpy as np
 from numpy import linalg as LA
 
-rnd = random.random
+
+@nb.jit()
+def uniform_in_sphere(u, v, w):
+    """
+    maps three uniform numbers to a uniform point inside the unit sphere: uniform direction and radius cbrt(w)
+    """
+    z = 1. - 2. * u
+    phi = 2. * np.pi * v
+    r = np.sqrt(max(1. - z ** 2, 0.))
+    return np.array([r * np.cos(phi), r * np.sin(phi), z]) * np.cbrt(w)
 
 
 @nb.jit()
-def _random_in_shpere():
+def random_in_unit_sphere(rng):
     """
-    helper funtion to create a random array with three elements
+    random point inside the unit sphere, drawn from the RandomStream rng
     """
-    return np.array([rnd(), rnd(), rnd()])
+    u = rng.next()
+    v = rng.next()
+    return uniform_in_sphere(u, v, rng.next())
 
 
 @nb.jit()
-def random_in_unit_sphere():
+def concentric_disk(u, v):
     """
-    helper funtion to create a random array with three elements but the last one is zero
+    maps (u, v) in the unit square to the unit disk (Shirley and Chiu concentric mapping), stratified
+    samples of the square stay stratified on the disk
     """
-    p = 2. * _random_in_shpere() - np.ones(3)
-    while (squared_length(p) >= 1.):
-        p = 2. * _random_in_shpere() - np.ones(3)
-    return p
+    a, b = 2. * u - 1., 2. * v - 1.
+    if a == 0. and b == 0.:
+        return np.zeros(3)
+    if abs(a) > abs(b):
+        r, phi = a, (np.pi / 4.) * (b / a)
+    else:
+        r, phi = b, np.pi / 2. - (np.pi / 4.) * (a / b)
+    return np.array([r * np.cos(phi), r * np.sin(phi), 0.])
 
 
 @nb.jit()
-def _random_in_disk():
-    return np.array([rnd(), rnd(), 0])
+def random_in_unit_disk(rng):
+    # point in the unit disk from the next two numbers of the RandomStream rng
+    u = rng.next()
+    return concentric_disk(u, rng.next())
 
 
 @nb.jit()
-def random_in_unit_disk():
-    p = 2. * _random_in_disk() - np.array([1, 1, 0])
-    while np.dot(p, p) >= 1.:
-        p = 2. * _random_in_disk() - np.array([1, 1, 0])
-    return p
+def uniform_hemisphere(u, v):
+    # uniform direction in the hemisphere around +z, pdf 1 / (2 pi)
+    z = u
+    phi = 2. * np.pi * v
+    r = np.sqrt(max(1. - z ** 2, 0.))
+    return np.array([r * np.cos(phi), r * np.sin(phi), z])
+
+
+@nb.jit()
+def cosine_hemisphere(u, v):
+    # cosine weighted direction in the hemisphere around +z (Malley's method), pdf cos(theta) / pi
+    point = concentric_disk(u, v)
+    point[2] = np.sqrt(max(1. - point[0] ** 2 - point[1] ** 2, 0.))
+    return point
+
+
+@nb.jit()
+def local_to_world(direction, normal):
+    # rotates a direction given around +z to the frame around the unit normal (Frisvad / Duff et al. basis)
+    sign = 1. if normal[2] >= 0. else -1.
+    a = -1. / (sign + normal[2])
+    b = normal[0] * normal[1] * a
+    tangent = np.array([1. + sign * normal[0] ** 2 * a, sign * b, -sign * normal[0]])
+    bitangent = np.array([b, sign + normal[1] ** 2 * a, -normal[1]])
+    return direction[0] * tangent + direction[1] * bitangent + direction[2] * normal
+
+
+@nb.jit()
+def dot(array1, array2):
+    return array1[0] * array2[0] + array1[1] * array2[1] + array1[2] * array2[2]
 
 
 @nb.jit()
@@ -46,7 +95,7 @@ def length(array):
 
 @nb.jit()
 def squared_length(array):
-    return LA.norm(array) ** 2
+    return dot(array, array)
 
 
 @nb.jit()
@@ -59,3 +108,71 @@ def cross(array1, array2):
     return np.array([array1[1] * array2[2] - array1[2] * array2[1],
                      array1[2] * array2[0] - array1[0] * array2[2],
                      array1[0] * array2[1] - array1[1] * array2[0]], dtype=np.float64)
+
+
+def uniform_in_sphere_batch(random):
+    # (N, 3) uniform points inside the unit sphere from (N, 3) uniform numbers
+    z = 1. - 2. * random[:, 0]
+    phi = 2. * np.pi * random[:, 1]
+    r = np.sqrt(np.maximum(1. - z ** 2, 0.))
+    directions = np.stack([r * np.cos(phi), r * np.sin(phi), z], axis=1)
+    return directions * np.cbrt(random[:, 2])[:, None]
+
+
+def concentric_disk_batch(random):
+    # (N, 3) points in the unit disk (z = 0) from (N, 2) uniform numbers
+    a, b = 2. * random[:, 0] - 1., 2. * random[:, 1] - 1.
+    use_a = np.abs(a) > np.abs(b)
+    safe_a = np.where(a == 0., 1., a)
+    safe_b = np.where(b == 0., 1., b)
+    r = np.where(use_a, a, b)
+    phi = np.where(use_a, (np.pi / 4.) * (b / safe_a), np.pi / 2. - (np.pi / 4.) * (a / safe_b))
+    points = np.stack([r * np.cos(phi), r * np.sin(phi), np.zeros_like(r)], axis=1)
+    points[(a == 0.) & (b == 0.)] = 0.
+    return points
+
+
+def uniform_hemisphere_batch(random):
+    # (N, 3) uniform directions in the hemisphere around +z from (N, 2) uniform numbers
+    z = random[:, 0]
+    phi = 2. * np.pi * random[:, 1]
+    r = np.sqrt(np.maximum(1. - z ** 2, 0.))
+    return np.stack([r * np.cos(phi), r * np.sin(phi), z], axis=1)
+
+
+def cosine_hemisphere_batch(random):
+    # (N, 3) cosine weighted directions in the hemisphere around +z from (N, 2) uniform numbers
+    points = concentric_disk_batch(random)
+    points[:, 2] = np.sqrt(np.maximum(1. - points[:, 0] ** 2 - points[:, 1] ** 2, 0.))
+    return points
+
+
+def local_to_world_batch(directions, normals):
+    # rotates (N, 3) directions given around +z to the frames around the (N, 3) unit normals
+    sign = np.where(normals[:, 2] >= 0., 1., -1.)
+    a = -1. / (sign + normals[:, 2])
+    b = normals[:, 0] * normals[:, 1] * a
+    tangents = np.stack([1. + sign * normals[:, 0] ** 2 * a, sign * b, -sign * normals[:, 0]], axis=1)
+    bitangents = np.stack([b, sign + normals[:, 1] ** 2 * a, -normals[:, 1]], axis=1)
+    return directions[:, :1] * tangents + directions[:, 1:2] * bitangents + directions[:, 2:] * normals
+
+
+def dot_batch(array1, array2):
+    # (N,) dot products of (N, 3) arrays
+    return np.einsum('ij,ij->i', array1, array2)
+
+
+def length_batch(array):
+    return np.sqrt(dot_batch(array, array))
+
+
+def squared_length_batch(array):
+    return dot_batch(array, array)
+
+
+def unit_vector_batch(array):
+    return array / length_batch(array)[:, None]
+
+
+def cross_batch(array1, array2):
+    return np.cross(array1, array2)
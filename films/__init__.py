@@ -0,0 +1,5 @@
+from .framebuffer import SharedFramebuffer, SQUARED_LUMINANCE, LUMINANCE_WEIGHTS, luminance, AOV_CHANNELS, DEPTH, \
+    NORMAL, ALBEDO, MATERIAL_ID, POSITION, MOTION
+from .denoiser import Denoiser
+from .ldr_film import LDRfilm, tonemap, write_png
+from .hdr_film import HDRfilm, open_pfm, write_pfm, read_pfm
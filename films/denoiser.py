@@ -0,0 +1,136 @@
+import numba as nb
+import numpy as np
+
+from .framebuffer import NORMAL, ALBEDO, DEPTH, LUMINANCE_WEIGHTS
+
+# 1D B3-spline kernel of the a-trous wavelet transform, the 2D kernel is its outer product
+_KERNEL = np.array([3. / 8., 1. / 4., 1. / 16.])
+_GAUSSIAN = np.array([1. / 2., 1. / 4.])  # 3x3 kernel used to smooth the variance
+
+# the render pool forks the process after a denoise, and a forked tbb (or gnu openmp) thread pool leaves the
+# process hanging at exit. The workqueue layer of numba can be forked, it is used unless another one was chosen
+if nb.config.THREADING_LAYER == 'default':
+    nb.config.THREADING_LAYER = 'workqueue'
+
+
+class Denoiser(object):
+    """
+    Edge-avoiding a-trous wavelet denoiser (Dammertz et al. 2010) guided by the primary hit aovs, with the
+    luminance edge-stopping function scaled by the noise of every pixel as in SVGF (Schied et al. 2017).
+
+    The radiance is divided by the albedo and the remaining irradiance is blurred with a 5x5 B3-spline kernel
+    whose taps are spread 2^i pixels apart in iteration i, so a few iterations cover a large footprint.
+    Every tap is weighted by how similar it is to the center pixel in normal, albedo and depth, so the blur
+    does not cross the edges of the guide buffers, and in luminance relative to the standard error of the
+    center pixel, so noisy pixels are blurred more than converged ones. The variance is filtered along with
+    the irradiance and the result is multiplied back by the albedo.
+
+    strength scales the luminance tolerance: 0 returns the input, larger values remove more noise at the cost
+    of detail in the lighting. The pixels are filtered tile by tile and the tiles of an iteration run in parallel
+    on all the cores (numba prange), each tile keeps the pixels it reads from the source close in memory.
+    """
+
+    def __init__(self, strength=1., iterations=3, luminance_sigma=4., normal_sigma=0.5, albedo_sigma=0.5,
+                 depth_sigma=0.03, tile_size=32):
+        self.strength = strength
+        self.iterations = iterations
+        self.luminance_sigma = luminance_sigma  # in standard errors of the luminance
+        self.normal_sigma = normal_sigma
+        self.albedo_sigma = albedo_sigma
+        self.depth_sigma = depth_sigma  # relative to the depth of the center pixel
+        self.tile_size = tile_size
+
+    def __call__(self, radiance, variance, normal, albedo, depth):
+        """
+        denoises the (H, W, 3) linear radiance given the (H, W) variance of its luminance, the (H, W, 3) normal
+        and albedo and the (H, W) or (H, W, 1) depth
+        """
+        if self.strength <= 0.:
+            return radiance.copy()
+
+        height, width = radiance.shape[:2]
+        depth = np.ascontiguousarray(depth, dtype=np.float64).reshape(height, width)
+        normal = np.ascontiguousarray(normal, dtype=np.float64)
+        albedo = np.ascontiguousarray(albedo, dtype=np.float64)
+        tiles = np.array([(row, col, min(row + self.tile_size, height), min(col + self.tile_size, width))
+                          for row in range(0, height, self.tile_size) for col in range(0, width, self.tile_size)],
+                         dtype=np.int64)
+
+        # filter the irradiance, the albedo texture is not blurred. The pixels where the rays missed have zero
+        # albedo and are filtered as they are
+        safe_albedo = np.where(albedo > 1e-3, albedo, 1.)
+        source = np.ascontiguousarray(radiance / safe_albedo)
+        source_variance = np.ascontiguousarray(variance / safe_albedo.dot(LUMINANCE_WEIGHTS) ** 2)
+        destination, destination_variance = np.empty_like(source), np.empty_like(source_variance)
+        for iteration in range(self.iterations):
+            _atrous_step(source, source_variance, destination, destination_variance, normal, albedo, depth,
+                         2 ** iteration, self.strength * self.luminance_sigma, self.normal_sigma, self.albedo_sigma,
+                         self.depth_sigma, tiles)
+            source, destination = destination, source
+            source_variance, destination_variance = destination_variance, source_variance
+        return source * safe_albedo
+
+    def denoise_framebuffer(self, framebuffer):
+        # denoised average radiance of a framebuffer with the normal, albedo and depth aovs
+        for name in (NORMAL, ALBEDO, DEPTH):
+            if name not in framebuffer.aovs_channels:
+                raise Exception('The framebuffer needs the %s aov to be denoised' % name)
+        variance = framebuffer.variance() / np.maximum(framebuffer.counts, 1.)  # variance of the pixel mean
+        return self(framebuffer.view(), variance, framebuffer.view(NORMAL), framebuffer.view(ALBEDO),
+                    framebuffer.view(DEPTH))
+
+
+@nb.jit(nopython=True)
+def _smoothed_variance(variance, row, col):
+    # 3x3 gaussian of the variance around a pixel, the per pixel estimates are noisy at low sample counts
+    height, width = variance.shape
+    total, total_weight = 0., 0.
+    for dy in range(-1, 2):
+        for dx in range(-1, 2):
+            r, c = row + dy, col + dx
+            if 0 <= r < height and 0 <= c < width:
+                weight = _GAUSSIAN[abs(dy)] * _GAUSSIAN[abs(dx)]
+                total += weight * variance[r, c]
+                total_weight += weight
+    return total / total_weight
+
+
+@nb.jit(nopython=True, parallel=True)
+def _atrous_step(source, source_variance, destination, destination_variance, normal, albedo, depth, step,
+                 luminance_sigma, normal_sigma, albedo_sigma, depth_sigma, tiles):
+    height, width = source.shape[0], source.shape[1]
+    inv_normal, inv_albedo = 1. / normal_sigma ** 2, 1. / albedo_sigma ** 2
+    for tile in nb.prange(tiles.shape[0]):  # the tiles only read the source, they run in parallel
+        for row in range(tiles[tile, 0], tiles[tile, 2]):
+            for col in range(tiles[tile, 1], tiles[tile, 3]):
+                center_luminance = np.dot(LUMINANCE_WEIGHTS, source[row, col])
+                luminance_scale = luminance_sigma * np.sqrt(_smoothed_variance(source_variance, row, col)) + 1e-6
+                center_depth = max(depth[row, col], 1e-6)
+
+                total = np.zeros(3)
+                total_variance, total_weight = 0., 0.
+                for dy in range(-2, 3):
+                    r = row + dy * step
+                    if r < 0 or r >= height:
+                        continue
+                    for dx in range(-2, 3):
+                        c = col + dx * step
+                        if c < 0 or c >= width:
+                            continue
+
+                        # differences with the center pixel
+                        normal_distance, albedo_distance = 0., 0.
+                        for channel in range(3):
+                            normal_distance += (normal[r, c, channel] - normal[row, col, channel]) ** 2
+                            albedo_distance += (albedo[r, c, channel] - albedo[row, col, channel]) ** 2
+                        luminance_distance = abs(np.dot(LUMINANCE_WEIGHTS, source[r, c]) - center_luminance)
+                        depth_distance = abs(depth[r, c] - depth[row, col]) / (depth_sigma * center_depth)
+
+                        weight = _KERNEL[abs(dy)] * _KERNEL[abs(dx)] * np.exp(
+                            -luminance_distance / luminance_scale - normal_distance * inv_normal -
+                            albedo_distance * inv_albedo - depth_distance)
+                        total += weight * source[r, c]
+                        total_variance += weight ** 2 * source_variance[r, c]
+                        total_weight += weight
+                destination[row, col] = total / total_weight
+                destination_variance[row, col] = total_variance / total_weight ** 2
@@ -0,0 +1,175 @@
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# integrators return the per pixel sum of the squared luminance of the samples with this key in the aovs
+SQUARED_LUMINANCE = 'squared_luminance'
+LUMINANCE_WEIGHTS = np.array([0.2126, 0.7152, 0.0722])
+
+
+def luminance(colors):
+    """
+    luminance of (..., 3) linear colors. It is summed channel by channel instead of with a BLAS product, whose
+    rounding can change with the number of BLAS threads, so every process gives the same bits
+    """
+    return colors[..., 0] * LUMINANCE_WEIGHTS[0] + colors[..., 1] * LUMINANCE_WEIGHTS[1] + \
+        colors[..., 2] * LUMINANCE_WEIGHTS[2]
+
+# outputs of the primary hit that the integrators can write with the radiance (see Integrator.aovs) and their
+# number of channels. They are accumulated per sample, so the film gives their average over the pixel.
+# Rays that miss the scene write zeros
+DEPTH = 'depth'  # distance from the camera to the hit
+NORMAL = 'normal'  # outward surface normal
+ALBEDO = 'albedo'  # albedo of the material, one for materials without albedo
+MATERIAL_ID = 'material_id'  # index of the material in the world, -1 if unknown
+POSITION = 'position'  # world position of the hit
+MOTION = 'motion'  # screen motion of the hit point in pixels while the shutter is open
+AOV_CHANNELS = {DEPTH: 1, NORMAL: 3, ALBEDO: 3, MATERIAL_ID: 1, POSITION: 3, MOTION: 2}
+
+
+class SharedFramebuffer(object):
+    """
+    Framebuffer stored in a single shared memory block.
+
+    It holds, for every pixel:
+        - radiance: (height, width, 3) accumulated linear radiance
+        - counts: (height, width) number of samples accumulated
+        - aovs: optional extra buffers, given as a dictionary {name: n_channels}, accumulated as the radiance
+        - luminance_mean, luminance_m2: running mean and sum of squared deviations of the sample luminance,
+          merged tile by tile with the parallel Welford update (Chan et al.)
+
+    Render workers attach to the block by name and add their finished tiles in place, so the
+    parent process does not need to receive the results and can read a live view at any time.
+    """
+
+    def __init__(self, width, height, aovs=None, name=None):
+        self.width, self.height = width, height
+        self.aovs_channels = dict(aovs or {})
+
+        # every buffer is a slice of the same block, one float64 per channel and pixel
+        self.channels = {'radiance': 3, 'counts': 1, 'luminance_mean': 1, 'luminance_m2': 1}
+        self.channels.update(self.aovs_channels)
+        self.n_values = height * width * sum(self.channels.values())
+        size = self.n_values * np.dtype(np.float64).itemsize
+
+        self.is_owner = name is None
+        if self.is_owner:
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+
+        self.buffers = {}
+        offset = 0
+        for buffer_name, n_channels in self.channels.items():
+            shape = (height, width) if n_channels == 1 and buffer_name not in self.aovs_channels else \
+                (height, width, n_channels)
+            self.buffers[buffer_name] = np.ndarray(shape, dtype=np.float64, buffer=self.shared_memory.buf,
+                                                   offset=offset)
+            offset += height * width * n_channels * np.dtype(np.float64).itemsize
+
+        if self.is_owner:
+            self.clear()
+
+    @classmethod
+    def attach(cls, descriptor):
+        # attach to an existing framebuffer from its descriptor
+        name, width, height, aovs = descriptor
+        return cls(width, height, aovs, name=name)
+
+    @property
+    def descriptor(self):
+        # small picklable description used by other processes to attach to the framebuffer
+        return self.shared_memory.name, self.width, self.height, self.aovs_channels
+
+    @property
+    def radiance(self):
+        return self.buffers['radiance']
+
+    @property
+    def counts(self):
+        return self.buffers['counts']
+
+    def aov(self, name):
+        return self.buffers[name]
+
+    def clear(self):
+        for buffer in self.buffers.values():
+            buffer[:] = 0.
+
+    def write_tile(self, cols, rows, radiance, n_samples, aovs=None):
+        """
+        adds the accumulated radiance and sample counts of the pixels (cols, rows) to the framebuffer.
+        Tiles do not overlap, so workers can write at the same time without locks
+        """
+        aovs = aovs or {}
+        if SQUARED_LUMINANCE in aovs:
+            self._merge_variance(cols, rows, radiance, n_samples, aovs[SQUARED_LUMINANCE])
+
+        self.radiance[rows, cols] += radiance
+        self.counts[rows, cols] += n_samples
+        for name, values in aovs.items():
+            if name in self.aovs_channels:
+                self.buffers[name][rows, cols] += values.reshape(len(rows), -1)
+
+    def _merge_variance(self, cols, rows, radiance, n_samples, squared_luminance):
+        # merge the mean and squared deviations of the new samples with the ones in the framebuffer
+        n_a, n_b = self.counts[rows, cols], np.asarray(n_samples, dtype=np.float64)
+        sampled = n_b > 0
+        n_b_safe = np.maximum(n_b, 1.)
+        mean_b = luminance(radiance) / n_b_safe
+        m2_b = np.maximum(squared_luminance - n_b * mean_b ** 2, 0.)
+
+        mean_a, m2_a = self.buffers['luminance_mean'][rows, cols], self.buffers['luminance_m2'][rows, cols]
+        n = n_a + n_b_safe
+        delta = mean_b - mean_a
+        self.buffers['luminance_mean'][rows, cols] = np.where(sampled, mean_a + delta * n_b / n, mean_a)
+        self.buffers['luminance_m2'][rows, cols] = np.where(sampled, m2_a + m2_b + delta ** 2 * n_a * n_b / n, m2_a)
+
+    def variance(self):
+        # sample variance of the luminance of every pixel, zero for pixels with less than two samples
+        return self.buffers['luminance_m2'] / np.maximum(self.counts - 1., 1.)
+
+    def relative_error(self, epsilon=1e-3):
+        """
+        standard error of the mean luminance of every pixel relative to the mean, infinite for pixels with
+        less than two samples
+        """
+        error = np.sqrt(self.variance() / np.maximum(self.counts, 1.)) / (self.buffers['luminance_mean'] + epsilon)
+        return np.where(self.counts < 2, np.inf, error)
+
+    def save(self, path):
+        """
+        writes all the buffers to the .npy file path through a memory map. The file is written next to path
+        and then renamed, so a crash while saving keeps the previous file
+        """
+        temporary_path = path + '.tmp.npy'
+        values = np.lib.format.open_memmap(temporary_path, mode='w+', dtype=np.float64, shape=(self.n_values,))
+        values[:] = np.frombuffer(self.shared_memory.buf, dtype=np.float64, count=self.n_values)
+        values.flush()
+        del values
+        os.replace(temporary_path, path)
+
+    def load(self, path):
+        # reads the buffers written by save, the framebuffer must have the same size and aovs
+        values = np.load(path, mmap_mode='r')
+        if values.shape != (self.n_values,):
+            raise Exception('%s does not match the size of the framebuffer' % path)
+        np.frombuffer(self.shared_memory.buf, dtype=np.float64, count=self.n_values)[:] = values
+
+    def view(self, name='radiance'):
+        """
+        returns the current average per sample of a buffer, pixels without samples are zero
+        """
+        counts = np.maximum(self.counts, 1.)
+        return self.buffers[name] / counts[:, :, None]
+
+    def image(self):
+        # gamma corrected image of the current radiance
+        return np.sqrt(self.view())
+
+    def close(self):
+        self.buffers = {}
+        self.shared_memory.close()
+        if self.is_owner:
+            self.shared_memory.unlink()
@@ -0,0 +1,129 @@
+import numpy as np
+
+from .ldr_film import LDRfilm
+
+
+def open_pfm(path, width, height):
+    """
+    creates the PFM file path for a (height, width) color image and returns a float32 (height, width, 3) memory map
+    of its pixels, so the image can be written in pieces. PFM stores the rows from the bottom to the top, as the
+    framebuffer
+    """
+    header = b'PF\n%d %d\n-1.0\n' % (width, height)  # negative scale means little endian
+    with open(path, 'wb') as file:
+        file.write(header)
+    return np.memmap(path, dtype='<f4', mode='r+', offset=len(header), shape=(height, width, 3))
+
+
+def write_pfm(path, image):
+    # writes a (height, width, 3) linear image to the PFM file path
+    pixels = open_pfm(path, image.shape[1], image.shape[0])
+    pixels[:] = image
+    pixels.flush()
+
+
+def read_pfm(path):
+    # reads a color PFM file into a float32 (height, width, 3) array
+    with open(path, 'rb') as file:
+        if file.readline().strip() != b'PF':
+            raise Exception('%s is not a color PFM file' % path)
+        width, height = map(int, file.readline().split())
+        scale = float(file.readline())
+        values = np.fromfile(file, dtype='<f4' if scale < 0 else '>f4', count=width * height * 3)
+    return values.reshape(height, width, 3).astype(np.float32)
+
+
+class HDRfilm(object):
+    """
+    Floating point film. The image is the ratio of the accumulated radiance and the weight (number of samples) of
+    every pixel.
+
+    The film is filled either with samples (add_samples), which are accumulated in float32 buffers of the film
+    allocated on the first call, or from a SharedFramebuffer as its tiles are finished (update_tile, for example
+    from Multithread.run(on_tile=...)), which is read in place and never copied. If path is given the resolved
+    pixels are also streamed to that PFM file every time they change, through a memory map, so a render stopped
+    halfway leaves the finished tiles on disk.
+    """
+
+    def __init__(self, width, height, path=None):
+        self.width, self.height = width, height
+        self.radiance = self.weights = None  # accumulation buffers of add_samples
+        self.source = None  # (radiance, weights) the image is resolved from
+        self.replaced = None  # image given to replace
+        self.output = open_pfm(path, width, height) if path is not None else None
+
+    def add_samples(self, cols, rows, radiance, weights):
+        """
+        adds the radiance sum and weights of the pixels (cols, rows), as returned by Integrator.render
+        """
+        if self.radiance is None:
+            self.radiance = np.zeros((self.height, self.width, 3), dtype=np.float32)
+            self.weights = np.zeros((self.height, self.width), dtype=np.float32)
+        self.radiance[rows, cols] += radiance
+        self.weights[rows, cols] += weights
+        self.source, self.replaced = (self.radiance, self.weights), None
+        self._stream((rows, cols))
+
+    def update_tile(self, tile, framebuffer):
+        # resolves the (col_start, row_start, col_end, row_end) tile of the framebuffer into the output
+        col_start, row_start, col_end, row_end = tile
+        self.source, self.replaced = (framebuffer.radiance, framebuffer.counts), None
+        self._stream((slice(row_start, row_end), slice(col_start, col_end)))
+
+    def update(self, framebuffer):
+        for start in range(0, self.height, 64):
+            self.update_tile((0, start, self.width, min(start + 64, self.height)), framebuffer)
+
+    def replace(self, image):
+        """
+        replaces the image of the film, for example with the denoised radiance. It is written to the output,
+        a later update or add_samples goes back to the samples
+        """
+        if self.output is not None:
+            self.output[:] = image
+            self.replaced = self.output
+        else:
+            self.replaced = image
+
+    def resolve(self, index):
+        # average radiance of the pixels at index, pixels without samples are zero
+        if self.replaced is not None:
+            return self.replaced[index]
+        if self.source is None:
+            return np.zeros((self.height, self.width, 3), dtype=np.float32)[index]
+        radiance, weights = self.source
+        return radiance[index] / np.maximum(weights[index], 1.)[..., None]
+
+    def image(self):
+        return self.resolve((slice(None), slice(None)))
+
+    def _stream(self, index):
+        if self.output is not None:
+            self.output[index] = self.resolve(index)
+
+    def write_pfm(self, path):
+        pixels = open_pfm(path, self.width, self.height)
+        for start in range(0, self.height, 64):
+            rows = (slice(start, start + 64), slice(None))
+            pixels[rows] = self.resolve(rows)
+        pixels.flush()
+
+    def write_png(self, path, ldr_film=None):
+        """
+        tone maps the image with ldr_film (an LDRfilm, the default one if None) and writes it to the PNG path,
+        the pixels are resolved block by block from the samples
+        """
+        ldr_film = ldr_film if ldr_film is not None else LDRfilm()
+        if self.replaced is not None or self.source is None:
+            ldr_film.save_image(self.image() if self.replaced is None else self.replaced, path)
+        else:
+            radiance, weights = self.source
+            ldr_film.save_image(radiance, path, lambda values, rows: values / np.maximum(weights[rows], 1.)[..., None])
+
+    def flush(self):
+        if self.output is not None:
+            self.output.flush()
+
+    def close(self):
+        self.flush()
+        self.output = self.replaced = self.source = None
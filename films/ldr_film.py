@@ -1,14 +1,96 @@
-import matplotlib.pyplot as plt
+import struct
+import zlib
+
+import numpy as np
+
+from .framebuffer import LUMINANCE_WEIGHTS
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def tonemap(radiance, exposure=1., gamma=2., operator=None):
+    """
+    maps linear radiance to display values in [0, 1]: scales by exposure, compresses the highlights with the
+    operator and applies the gamma. operator is None (clip), 'reinhard' (L / (1 + L) on the luminance, keeps
+    the hue) or 'aces' (Narkowicz fit of the ACES filmic curve per channel)
+    """
+    values = np.maximum(radiance * exposure, 0.)
+    if operator == 'reinhard':
+        luminance = values.dot(LUMINANCE_WEIGHTS)[..., None]
+        values = values / (1. + luminance)
+    elif operator == 'aces':
+        values = values * (2.51 * values + 0.03) / (values * (2.43 * values + 0.59) + 0.14)
+    elif operator is not None:
+        raise Exception('Unknown tone mapping operator %s' % operator)
+    return np.clip(values, 0., 1.) ** (1. / gamma)
+
+
+def write_png(path, image, transform=None, block_rows=64):
+    """
+    writes an (H, W, 3) color or (H, W) gray image with values in [0, 1] to an 8 bit PNG. The rows of the image go
+    from the bottom to the top, as in the framebuffer.
+
+    The image is quantized and compressed in blocks of block_rows rows, transform(values, rows) is applied to
+    every block (rows is the slice of the block in image) so the whole converted image is never held in memory
+    """
+    height, width = image.shape[:2]
+    color_type = 2 if image.ndim == 3 else 0
+
+    with open(path, 'wb') as file:
+        file.write(_PNG_SIGNATURE)
+        _write_chunk(file, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+        compressor = zlib.compressobj()
+
+        # the PNG goes from the top row to the bottom one
+        for end in range(height, 0, -block_rows):
+            rows = slice(max(end - block_rows, 0), end)
+            values = image[rows] if transform is None else transform(image[rows], rows)
+            values = np.round(np.clip(values[::-1], 0., 1.) * 255.).astype(np.uint8).reshape(values.shape[0], -1)
+            scanlines = np.concatenate([np.zeros((values.shape[0], 1), dtype=np.uint8), values], axis=1)  # no filter
+            data = compressor.compress(scanlines.tobytes())
+            if data:
+                _write_chunk(file, b'IDAT', data)
+        _write_chunk(file, b'IDAT', compressor.flush())
+        _write_chunk(file, b'IEND', b'')
+
+
+def _write_chunk(file, chunk_type, data):
+    file.write(struct.pack('>I', len(data)))
+    file.write(chunk_type)
+    file.write(data)
+    file.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
 
 
 class LDRfilm(object):
+    """
+    8 bit output of the linear radiance: tone mapped with the exposure, operator and gamma of the film (see
+    tonemap) and written as PNG without matplotlib, so it works on machines without a display.
+    The default gamma 2 gives the same image as the square root used for the previews.
+    """
 
-    def save_image(self, img, path):
+    def __init__(self, exposure=1., gamma=2., operator=None):
+        self.exposure = exposure
+        self.gamma = gamma
+        self.operator = operator
+
+    def tonemap(self, radiance):
+        return tonemap(radiance, self.exposure, self.gamma, self.operator)
+
+    def save_image(self, img, path, transform=None):
+        """
+        writes the (H, W, 3) linear radiance img to the PNG path. transform(values, rows) is applied to the
+        blocks of rows before tone mapping them, for example to divide the radiance by the sample weights
+        """
+        if transform is None:
+            write_png(path, img, lambda values, rows: self.tonemap(values))
+        else:
+            write_png(path, img, lambda values, rows: self.tonemap(transform(values, rows)))
+
+    def show_img(self, img):
+        # shows the tone mapped image in a window, matplotlib is only needed here
+        import matplotlib.pyplot as plt
         plt.figure()
         plt.axis('equal')
-        plt.imshow(img, origin='lower')
+        plt.imshow(self.tonemap(img), origin='lower')
         plt.axis('off')
         plt.show()
-        plt.imsave('images/' + out_name + '.png', multithread.out_img, origin='lower')
-
-    def show_img(self):
@@ -1,4 +1,5 @@
 from .hitable import *
 from .aabb import AABB, sorrounding_box
 from .sphere import *
-
+from .sphere_set import SphereSet
+from .lights import SphereLights
@@ -10,6 +10,13 @@ class Hitable(object):
     def hit(self, ray, t_min, t_max):
         raise NotImplementedError()
 
+    def occluded(self, ray, t_min, t_max):
+        """
+        any-hit query, True if the ray hits something inside (t_min, t_max). Geometries override it to return
+        on the first intersection found without building the hit record
+        """
+        return self.hit(ray, t_min, t_max)[0]
+
     def bounding_box(self, t0, t1):
         raise NotImplementedError()
 
@@ -39,11 +46,17 @@ class HitableList(Hitable):
         # return if something was hit
         return hit_anything, hit_record
 
+    def occluded(self, ray, t_min, t_max):
+        for hitable in self.hitable_array:
+            if hitable.occluded(ray, t_min, t_max):
+                return True
+        return False
+
     def bounding_box(self, t0, t1):
 
         # there is nothing to hit
-        if len(self.hitable_array < 1):
-            return False
+        if len(self.hitable_array) < 1:
+            return False, None
 
         # get bounding box of the first object
         is_bbox, bbox = self.hitable_array[0].bounding_box(t0, t1)
@@ -0,0 +1,114 @@
+import math
+
+import numpy as np
+
+from .sphere import sphere_intersect
+
+
+class SphereLights(object):
+    """
+    List of the spherical lights of a scene, the spheres with an emissive material (see DiffuseLight),
+    stored as arrays like a SphereSet:
+        - centers, velocities: (L, 3) float64, center(t) = centers + t * velocities
+        - radii: (L,) float64
+        - emit: (L, 3) float64, emitted radiance
+
+    A light is chosen uniformly and a direction towards it is sampled uniformly inside the cone it subtends
+    from the shaded point, so every sampled direction hits the light. The lights are assumed not to overlap
+    as seen from the shaded points.
+    """
+
+    def __init__(self, centers, velocities, radii, emit):
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        self.velocities = np.asarray(velocities, dtype=np.float64).reshape(-1, 3)
+        self.radii = np.asarray(radii, dtype=np.float64)
+        self.emit = np.asarray(emit, dtype=np.float64).reshape(-1, 3)
+
+    @classmethod
+    def from_world(cls, world):
+        """
+        collects the emissive spheres of a world made of LinearBVH, BVH_node, HitableList, SphereSet, Sphere
+        and MovingSphere objects
+        """
+        spheres = []  # (center, velocity, radius, emit)
+        visited = set()
+
+        def collect(hitable):
+            if id(hitable) in visited:  # BVH leaves hold the same hitable as both children
+                return
+            visited.add(id(hitable))
+
+            if hasattr(hitable, 'spheres'):  # LinearBVH
+                collect(hitable.spheres)
+            elif hasattr(hitable, 'left'):  # BVH_node
+                collect(hitable.left)
+                collect(hitable.right)
+            elif hasattr(hitable, 'hitable_array'):  # HitableList
+                for child in hitable.hitable_array:
+                    collect(child)
+            elif hasattr(hitable, 'material_ids'):  # SphereSet
+                for idx in range(len(hitable)):
+                    emit = hitable.material(idx).emitted()
+                    if np.any(emit > 0.):
+                        spheres.append((hitable.centers[idx], hitable.velocities[idx], hitable.radii[idx], emit))
+            elif hasattr(hitable, 'center_and_velocity'):  # Sphere, MovingSphere
+                emit = hitable.material.emitted()
+                if np.any(emit > 0.):
+                    spheres.append((*hitable.center_and_velocity(), hitable.radius, emit))
+            else:
+                raise Exception('Can not look for lights in %s' % hitable.__class__.__name__)
+
+        collect(world)
+        if not spheres:
+            return cls(np.zeros((0, 3)), np.zeros((0, 3)), np.zeros(0), np.zeros((0, 3)))
+        return cls(*[np.array(values) for values in zip(*spheres)])
+
+    def _cones(self, point, time):
+        # unit directions to the centers, distances and cosine of the half angle of the cone of every light
+        to_centers = self.centers + time * self.velocities - point
+        distances = np.linalg.norm(to_centers, axis=1)
+        outside = distances > self.radii
+        cos_max = np.sqrt(np.maximum(1. - (self.radii / np.maximum(distances, 1e-12)) ** 2, 0.))
+        return to_centers / np.maximum(distances, 1e-12)[:, None], cos_max, outside
+
+    def sample(self, point, time, u_light, u_0, u_1):
+        """
+        samples a light and a direction towards it from point with three uniform numbers. Returns the unit
+        direction, the distance to the light, its emitted radiance and the solid angle pdf (zero if no direction
+        could be sampled)
+        """
+        n = len(self)
+        if n == 0:
+            return None, 0., np.zeros(3), 0.
+        light = min(int(u_light * n), n - 1)
+        axes, cos_max, outside = self._cones(point, time)
+        if not outside[light]:
+            return None, 0., np.zeros(3), 0.
+
+        # uniform direction in the cone around the axis to the center
+        w = axes[light]
+        cos_theta = 1. - u_0 * (1. - cos_max[light])
+        sin_theta = math.sqrt(max(1. - cos_theta ** 2, 0.))
+        phi = 2. * math.pi * u_1
+        helper = np.array([1., 0., 0.]) if abs(w[0]) < 0.9 else np.array([0., 1., 0.])
+        u = np.cross(helper, w)
+        u /= np.linalg.norm(u)
+        v = np.cross(w, u)
+        direction = (sin_theta * math.cos(phi)) * u + (sin_theta * math.sin(phi)) * v + cos_theta * w
+
+        center = self.centers[light] + time * self.velocities[light]
+        distance = sphere_intersect(point, direction, center, self.radii[light], 0., np.inf)
+        if not np.isfinite(distance):  # grazing the border of the cone
+            return None, 0., np.zeros(3), 0.
+        return direction, distance, self.emit[light], self.pdf(point, direction, time)
+
+    def pdf(self, point, direction, time):
+        # solid angle pdf of sample returning the unit direction from point
+        if len(self) == 0:
+            return 0.
+        axes, cos_max, outside = self._cones(point, time)
+        inside_cone = outside & (axes.dot(direction) >= cos_max)
+        return np.sum(1. / (2. * np.pi * (1. - cos_max[inside_cone]))) / len(self)
+
+    def __len__(self):
+        return len(self.radii)
@@ -52,9 +52,18 @@ class Sphere(Hitable):
                 return True, hit_record
         return False, None
 
+    def occluded(self, ray, t_min, t_max):
+        return sphere_intersect(ray.origin, ray.direction, self.center, self.radius, t_min, t_max) < t_max
+
     def bounding_box(self, t0, t1):
         return True, AABB(self.center - self.radius, self.center + self.radius)
 
+    def center_and_velocity(self):
+        """
+        returns the center at time 0 and the velocity of the center, so center(t) = center + t * velocity
+        """
+        return self.center, np.zeros(3)
+
     def get_normal(self, ray):
         t = self.ray_intersect(ray)
         if t > 0.:
@@ -95,7 +104,8 @@ class MovingSphere(Sphere):
                     t=temp,
                     point=point,
                     normal=(point - self.center(ray.time)) / self.radius,
-                    material=self.material)
+                    material=self.material,
+                    velocity=self.center_and_velocity()[1])
                 return True, hit_record
 
             temp = (-second + math.sqrt(discriminant)) / first
@@ -105,10 +115,18 @@ class MovingSphere(Sphere):
                     t=temp,
                     point=point,
                     normal=(point - self.center(ray.time)) / self.radius,
-                    material=self.material)
+                    material=self.material,
+                    velocity=self.center_and_velocity()[1])
                 return True, hit_record
         return False, None
 
+    def occluded(self, ray, t_min, t_max):
+        return sphere_intersect(ray.origin, ray.direction, self.center(ray.time), self.radius, t_min, t_max) < t_max
+
+    def center_and_velocity(self):
+        velocity = (np.asarray(self.center1, dtype=np.float64) - self.center0) / (self.time1 - self.time0)
+        return self.center0 - self.time0 * velocity, velocity
+
     def bounding_box(self, t0, t1):
         bounding_box_t0 = AABB(self.center(self.time0) - self.radius, self.center(self.time0) + self.radius)
         bounding_box_t1 = AABB(self.center(self.time1) - self.radius, self.center(self.time1) + self.radius)
@@ -121,3 +139,28 @@ class MovingSphere(Sphere):
             return 0.5 * (normal + 1.)
         else:
             return None
+
+
+@nb.jit(nopython=True)
+def sphere_intersect(origin, direction, center, radius, t_min, t_max):
+    """
+    returns the closest intersection distance of the ray with the sphere inside (t_min, t_max),
+    or inf if there is no intersection. Same computation as Sphere.hit
+    """
+    ray_to_center = origin - center
+
+    first = np.dot(direction, direction)
+    second = np.dot(direction, ray_to_center)
+    third = np.dot(ray_to_center, ray_to_center) - radius ** 2
+
+    discriminant = second ** 2 - first * third
+
+    if discriminant > 0.:
+        temp = (-second - math.sqrt(discriminant)) / first
+        if temp < t_max and temp > t_min:
+            return temp
+
+        temp = (-second + math.sqrt(discriminant)) / first
+        if temp < t_max and temp > t_min:
+            return temp
+    return np.inf
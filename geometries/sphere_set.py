@@ -0,0 +1,165 @@
+import numba as nb
+import numpy as np
+
+from core import HitPoint
+from .aabb import AABB
+from .hitable import Hitable
+from .sphere import sphere_intersect
+
+
+class SphereSet(Hitable):
+    """
+    Structure of arrays container for static and moving spheres.
+
+    The spheres are stored in flat arrays instead of one python object per sphere:
+        - centers: (N, 3) float64, center of the sphere at time 0
+        - velocities: (N, 3) float64, so center(t) = centers + t * velocities
+        - radii: (N,) float64
+        - material_ids: (N,) int32, index in the materials list
+
+    A ray, or a batch of rays, is intersected against all the spheres in a single jitted kernel.
+    """
+
+    def __init__(self, centers, velocities, radii, material_ids, materials):
+        self.centers = np.ascontiguousarray(centers, dtype=np.float64).reshape(-1, 3)
+        self.velocities = np.ascontiguousarray(velocities, dtype=np.float64).reshape(-1, 3)
+        self.radii = np.ascontiguousarray(radii, dtype=np.float64)
+        self.material_ids = np.ascontiguousarray(material_ids, dtype=np.int32)
+        self.materials = list(materials)
+
+    @classmethod
+    def from_hitables(cls, hitable_list):
+        """
+        build the set from a list of Sphere and MovingSphere objects. Materials shared by several
+        spheres are stored only once
+        """
+        n = len(hitable_list)
+        centers, velocities, radii = np.zeros((n, 3)), np.zeros((n, 3)), np.zeros(n)
+        material_ids = np.zeros(n, dtype=np.int32)
+        materials, material_idx = [], {}
+
+        for idx, hitable in enumerate(hitable_list):
+            if not hasattr(hitable, 'center_and_velocity'):
+                raise Exception('SphereSet only supports spheres, got %s' % hitable.__class__.__name__)
+            centers[idx], velocities[idx] = hitable.center_and_velocity()
+            radii[idx] = hitable.radius
+
+            if id(hitable.material) not in material_idx:
+                material_idx[id(hitable.material)] = len(materials)
+                materials.append(hitable.material)
+            material_ids[idx] = material_idx[id(hitable.material)]
+
+        return cls(centers, velocities, radii, material_ids, materials)
+
+    def material(self, idx):
+        return self.materials[self.material_ids[idx]]
+
+    def center(self, idx, time):
+        return self.centers[idx] + time * self.velocities[idx]
+
+    def hit_record(self, idx, ray, t):
+        # build the HitPoint of the ray hitting the sphere idx at distance t
+        point = ray.point_at_parameter(t)
+        return HitPoint(t=t,
+                        point=point,
+                        normal=(point - self.center(idx, ray.time)) / self.radii[idx],
+                        material=self.material(idx),
+                        material_id=self.material_ids[idx],
+                        velocity=self.velocities[idx])
+
+    def hit(self, ray, t_min, t_max):
+        idx, t = _hit_spheres(ray.origin, ray.direction, ray.time, t_min, t_max,
+                              self.centers, self.velocities, self.radii)
+        if idx < 0:
+            return False, None
+        return True, self.hit_record(idx, ray, t)
+
+    def occluded(self, ray, t_min, t_max):
+        return _occluded_spheres(ray.origin, ray.direction, ray.time, t_min, t_max,
+                                 self.centers, self.velocities, self.radii)
+
+    def hit_batch(self, origins, directions, times, t_min, t_max):
+        """
+        intersect N rays given as (N, 3) origins and directions and (N,) times.
+        Returns the (N,) sphere indices (-1 for no hit) and hit distances
+        """
+        return _hit_spheres_batch(origins, directions, times, t_min, t_max,
+                                  self.centers, self.velocities, self.radii)
+
+    def occluded_batch(self, origins, directions, times, t_min, t_max):
+        """
+        any-hit query of N rays, t_min and t_max can be scalars or (N,) arrays. Returns a (N,) boolean mask
+        of the rays that hit a sphere
+        """
+        n = origins.shape[0]
+        return _occluded_spheres_batch(origins, directions, times, np.broadcast_to(np.float64(t_min), n),
+                                       np.broadcast_to(np.float64(t_max), n),
+                                       self.centers, self.velocities, self.radii)
+
+    def surface_batch(self, idxs, origins, directions, times, ts):
+        """
+        returns the hit points, the normals and the material ids of a batch of rays hitting the spheres idxs
+        at distances ts
+        """
+        points = origins + ts[:, None] * directions
+        centers = self.centers[idxs] + times[:, None] * self.velocities[idxs]
+        normals = (points - centers) / self.radii[idxs, None]
+        return points, normals, self.material_ids[idxs]
+
+    def velocity_batch(self, idxs):
+        return self.velocities[idxs]
+
+    def bounding_box(self, t0, t1):
+        if len(self) < 1:
+            return False, None
+
+        centers_t0 = self.centers + t0 * self.velocities
+        centers_t1 = self.centers + t1 * self.velocities
+        radii = self.radii[:, None]
+        min = np.minimum(centers_t0 - radii, centers_t1 - radii).min(axis=0)
+        max = np.maximum(centers_t0 + radii, centers_t1 + radii).max(axis=0)
+        return True, AABB(min, max)
+
+    def __len__(self):
+        return len(self.radii)
+
+
+@nb.jit(nopython=True)
+def _hit_spheres(origin, direction, time, t_min, t_max, centers, velocities, radii):
+    closest = t_max
+    hit_idx = -1
+    for idx in range(radii.shape[0]):
+        t = sphere_intersect(origin, direction, centers[idx] + time * velocities[idx], radii[idx], t_min, closest)
+        if t < closest:
+            closest = t
+            hit_idx = idx
+    return hit_idx, closest
+
+
+@nb.jit(nopython=True)
+def _occluded_spheres(origin, direction, time, t_min, t_max, centers, velocities, radii):
+    # returns on the first sphere hit
+    for idx in range(radii.shape[0]):
+        if sphere_intersect(origin, direction, centers[idx] + time * velocities[idx], radii[idx], t_min, t_max) < t_max:
+            return True
+    return False
+
+
+@nb.jit(nopython=True)
+def _hit_spheres_batch(origins, directions, times, t_min, t_max, centers, velocities, radii):
+    n = origins.shape[0]
+    idxs = np.empty(n, dtype=np.int64)
+    ts = np.empty(n)
+    for ray_idx in range(n):
+        idxs[ray_idx], ts[ray_idx] = _hit_spheres(origins[ray_idx], directions[ray_idx], times[ray_idx],
+                                                  t_min, t_max, centers, velocities, radii)
+    return idxs, ts
+
+
+@nb.jit(nopython=True)
+def _occluded_spheres_batch(origins, directions, times, t_mins, t_maxs, centers, velocities, radii):
+    occluded = np.empty(origins.shape[0], dtype=np.bool_)
+    for ray_idx in range(origins.shape[0]):
+        occluded[ray_idx] = _occluded_spheres(origins[ray_idx], directions[ray_idx], times[ray_idx],
+                                              t_mins[ray_idx], t_maxs[ray_idx], centers, velocities, radii)
+    return occluded
@@ -1,3 +1,7 @@
 from .path_tracer import PathTracer
 from .depth import Depth
 from .surface_normal import SurfaceNormal
+from .wavefront import WavefrontPathTracer
+from .iterative import IterativePathTracer
+from .mis import MISPathTracer
+from .compiled import CompiledPathTracer
@@ -0,0 +1,129 @@
+import numba as nb
+import numpy as np
+
+from core.hit import HitRecord
+from core.linear_bvh import LinearBVH, _intersect
+from core.rng import RandomStream
+from core.samplers import bounce_number
+from films import SQUARED_LUMINANCE, LUMINANCE_WEIGHTS
+from geometries import SphereSet
+from materials import MaterialTable
+from materials.kernels import scatter
+from .integrator import Integrator, sky_color
+
+
+class CompiledPathTracer(Integrator):
+    """
+    Path tracer that runs in a single nopython kernel.
+
+    The scene is passed to the kernel as arrays: the nodes of the LinearBVH, the spheres and the
+    parameters of a MaterialTable. Every sample goes camera ray -> traversal -> scatter -> accumulation
+    without going back to the interpreter, the materials are evaluated by type id and the hits are stored
+    in a HitRecord.
+
+    The world must be a LinearBVH or a SphereSet (traversed as a BVH with a single leaf). The random
+    numbers are drawn in the same order as in PathTracer, so both integrators render the same image.
+    """
+
+    def __init__(self, samples_per_pixel, width, height, max_depth=50, seed=0, sampler=None, pixels_per_call=64):
+        self.samples_per_pixel = samples_per_pixel
+        self.height = height
+        self.width = width
+        self.max_depth = max_depth
+        self.seed = seed
+        self.sampler = sampler
+        self.pixels_per_call = pixels_per_call  # pixels rendered by each kernel call, progress is reported between them
+        self.n_rays = 0  # rays traced by this process
+
+    def render(self, cols, rows, camera, world, reporter=None):
+        nodes, spheres = _scene_arrays(world)
+        material_table = MaterialTable(spheres.materials)
+        materials = (spheres.material_ids, material_table.type_ids, material_table.albedo, material_table.fuzzy,
+                     material_table.refraction_index, material_table.emit)
+
+        # first numbers of the paths of all the samples of the tile, (pixels, samples, n)
+        pixel_ids = self.pixel_ids(cols, rows)
+        samples = self.sample_offset + np.arange(self.samples_per_pixel)
+        path_samples = self.path_samples(np.repeat(pixel_ids, self.samples_per_pixel),
+                                         np.tile(samples, cols.shape[0]), self.max_depth)
+        path_samples = path_samples.reshape((cols.shape[0], self.samples_per_pixel, -1))
+
+        color_values = np.zeros((*cols.shape, 3))
+        squared_luminance = np.zeros(cols.shape)  # used by the film to estimate the variance
+        for start in range(0, cols.shape[0], self.pixels_per_call):
+            pixels = slice(start, start + self.pixels_per_call)
+            n_rays = _render_pixels(cols[pixels], rows[pixels], pixel_ids[pixels], samples, path_samples[pixels],
+                                    self.width, self.height, self.seed, self.max_depth, camera,
+                                    color_values[pixels], squared_luminance[pixels],
+                                    *nodes, spheres.centers, spheres.velocities, spheres.radii, *materials)
+            self.n_rays += n_rays
+
+            if reporter is not None:
+                n_pixels = cols[pixels].shape[0]
+                reporter.update(pixels=n_pixels, samples=n_pixels * self.samples_per_pixel, rays=n_rays)
+
+        return color_values, np.full(cols.shape, self.samples_per_pixel), {SQUARED_LUMINANCE: squared_luminance}
+
+
+def _scene_arrays(world):
+    """
+    returns the node arrays (mins, maxs, offsets, counts, axes, stack size) and the SphereSet of the world
+    """
+    if isinstance(world, LinearBVH):
+        return (world.node_mins, world.node_maxs, world.node_offsets, world.node_counts, world.node_axes,
+                world.max_depth + 1), world.spheres
+
+    if isinstance(world, SphereSet):
+        # a single leaf with all the spheres
+        _, bbox = world.bounding_box(0, 1)
+        nodes = (bbox.min[None].astype(np.float64), bbox.max[None].astype(np.float64),
+                 np.zeros(1, dtype=np.int32), np.full(1, len(world), dtype=np.int32), np.zeros(1, dtype=np.int32), 1)
+        return nodes, world
+
+    raise Exception('CompiledPathTracer needs a LinearBVH or a SphereSet world, got %s' % world.__class__.__name__)
+
+
+@nb.jit(nopython=True)
+def _render_pixels(cols, rows, pixel_ids, samples, path_samples, width, height, seed, max_depth, camera,
+                   color_values, squared_luminance,
+                   node_mins, node_maxs, node_offsets, node_counts, node_axes, stack_size,
+                   centers, velocities, radii, material_ids, type_ids, albedo, fuzzy, refraction_index, emit):
+    # adds the samples of the pixels to color_values and squared_luminance, returns the number of rays traced
+    n_rays = 0
+    for idx in range(cols.shape[0]):
+        for s in range(samples.shape[0]):
+            rng = RandomStream(seed, pixel_ids[idx], samples[s], 0, path_samples[idx, s])
+            u = (cols[idx] + rng.next()) / width
+            v = (rows[idx] + rng.next()) / height
+            ray = camera.get_ray(u, v, rng)
+
+            # follow the path multiplying the attenuation of every bounce
+            color = np.zeros(3)
+            throughput = np.ones(3)
+            for depth in range(max_depth + 1):
+                n_rays += 1
+                prim, t, _ = _intersect(ray.origin, ray.direction, ray.time, 0.001, np.inf,
+                                        node_mins, node_maxs, node_offsets, node_counts, node_axes,
+                                        centers, velocities, radii, stack_size)
+
+                if prim < 0:  # background blue color
+                    color += throughput * sky_color(ray.direction)
+                    break
+
+                point = ray.point_at_parameter(t)
+                normal = (point - (centers[prim] + ray.time * velocities[prim])) / radii[prim]
+                hit_record = HitRecord(t, point, normal, material_ids[prim])
+                color += throughput * emit[material_ids[prim]]
+
+                # paths absorbed or reaching max_depth are black
+                rng.dim = bounce_number(depth)
+                is_scattered, scattered, attenuation = scatter(ray, hit_record, rng, type_ids, albedo, fuzzy,
+                                                               refraction_index)
+                if depth == max_depth or not is_scattered:
+                    break
+                throughput = throughput * attenuation
+                ray = scattered
+
+            color_values[idx] += color
+            squared_luminance[idx] += np.dot(color, LUMINANCE_WEIGHTS) ** 2
+    return n_rays
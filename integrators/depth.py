@@ -1,28 +1,23 @@
 from .integrator import Integrator
 import numpy as np
+from core.rng import RandomStream
 from core.vec_utils import unit_vector
-import random
-from tqdm import tqdm
-from multiprocessing import Value
-
-rand = random.random
-
-global pbar, pbar_update
-
-pbar_update = Value('i', 0)  # create a value to track progress
 
 
 class Depth(Integrator):
-    def __init__(self, width, height):
-        global pbar
+    """
+    Distance from the camera to the first hit of the ray through every pixel corner, white where nothing is hit.
+    The path tracers write the same output during the render with the DEPTH aov
+    """
 
+    def __init__(self, width, height):
         self.height = height
         self.width = width
-        pbar = tqdm(total=(width * height))
 
-    def run(self, cols, rows, get_ray, world):
-        global pbar, pbar_update
+    def render(self, cols, rows, camera, world, reporter=None):
         color_values = np.zeros((*cols.shape, 3))
+        pixel_ids = self.pixel_ids(cols, rows)
+        camera_samples = self.camera_samples(pixel_ids, np.full(cols.shape, self.sample_offset))
 
         for idx in range(cols.shape[0]):
             row, col = rows[idx], cols[idx]
@@ -32,27 +27,26 @@ class Depth(Integrator):
             v = row / self.height
 
             # trace ray
-            ray = get_ray(u, v)
+            # the ray goes through the pixel corner, the pixel jitter numbers are skipped
+            rng = RandomStream(self.seed, pixel_ids[idx], self.sample_offset, 2, camera_samples[idx])
+            ray = camera.get_ray(u, v, rng)
 
             # get color of the intersected objects
             color = self._get_color(ray, world, depth=0, max_depth=50)
 
-            # normalize color for the number of samples and store it
-            color_values[idx] = np.sqrt(color)
+            # store the color, it is gamma corrected by the film
+            color_values[idx] = color
 
-            # update progress bar
-            with pbar_update.get_lock():
-                pbar_update.value += 1
-                pbar.n = pbar_update.value
-                pbar.refresh()
+            # report progress, the reporter only shares it every few pixels
+            if reporter is not None:
+                reporter.update(pixels=1, samples=1, rays=1)
 
-        return color_values, rows, cols
+        return color_values, np.ones(cols.shape), {}
 
     def _get_color(self, ray, world, depth, max_depth=50):
-        if world.hit(ray, 0.001, float("inf")):  # return normal of a hit with an item in the world
-            hit_record = world.hit_record
-            # print(hit_record.t)
-            return hit_record.t
+        world_hit, hit_record = world.hit(ray, 0.001, float("inf"))
+        if world_hit:  # return the distance to the hit with an item in the world
+            return np.full(3, hit_record.t * np.linalg.norm(ray.direction))
 
         else:  # if there is no hit return white color
-            return np.array(1, 1, 1)
+            return np.ones(3)
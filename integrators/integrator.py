@@ -1,10 +1,142 @@
+import numba as nb
+import numpy as np
+
+from core.camera import project
+from core.vec_utils import unit_vector
+from core.samplers import RandomSampling, PIXEL_DIMENSION, LENS_DIMENSION, TIME_DIMENSION, FIRST_BOUNCE_DIMENSION, \
+    BOUNCE_DIMENSIONS
+from films import AOV_CHANNELS, DEPTH, NORMAL, ALBEDO, MATERIAL_ID, POSITION, MOTION
+
+_random_sampling = RandomSampling(N=1)
+
+
+@nb.jit(nopython=True)
+def sky_color(direction):
+    # background blue color seen by a ray that misses the scene
+    t = 0.5 * (unit_vector(direction)[1] + 1.)
+    return (1. - t) * np.ones(3) + t * np.array([0.5, 0.7, 1.])
+
+
+def sky_color_batch(directions):
+    t = 0.5 * (directions[:, 1] / np.linalg.norm(directions, axis=1) + 1.)
+    return (1. - t)[:, None] * np.ones(3) + t[:, None] * np.array([0.5, 0.7, 1.])
+
+
 class Integrator():
+    """
+    The random numbers of every sample are drawn from a RandomStream keyed by (seed, pixel, sample), with
+    the samples of a pixel numbered from sample_offset. Renders with the same seed and sample_offset give
+    the same image whatever the number of cores and the order of the tiles, and setting sample_offset
+    to the samples already taken continues a render with new samples.
+
+    The pixel, lens and time samples and the numbers of the first sampled_bounces bounces are given by sampler,
+    a Sampler from core.samplers. The following bounces, and every number if sampler is None, are independent
+    random numbers. Every bounce draws from its own dimensions (see core.samplers.bounce_number), so the
+    same number is used for the same decision whatever the materials hit before.
+
+    The path tracers also write the outputs of the primary hit named in aovs (see films.AOV_CHANNELS) during
+    the same traversal, the framebuffer needs to be created with aov_channels().
+    """
+    seed = 0
+    sample_offset = 0
+    sampler = None
+    sampled_bounces = 4
+    aovs = ()
+
     def __init__(self):
         pass
 
-    def run(self):
+    def run(self, cols, rows, camera, world):
+        # gamma corrected average color of every pixel
+        radiance, n_samples, _ = self.render(cols, rows, camera, world)
+        return np.sqrt(radiance / n_samples[:, None]), rows, cols
+
+    def render(self, cols, rows, camera, world, reporter=None):
+        """
+        renders the pixels (cols, rows) seen by the camera. Returns for every pixel the accumulated linear
+        radiance (N, 3), the number of samples accumulated (N,) and a dictionary with the accumulated
+        extra outputs (AOVs).
+        The progress is reported through reporter.update(pixels, samples, rays) if a reporter is given
+        """
         raise NotImplementedError
 
+    def pixel_ids(self, cols, rows):
+        # index of every pixel in the image, used to key its random numbers
+        return rows * self.width + cols
+
+    def camera_samples(self, pixel_ids, sample_indices):
+        """
+        returns the (N, 5) camera numbers of the paths (pixel ids, sample indices): pixel jitter, lens point
+        and time. They are the first dimensions of the RandomStream of each path
+        """
+        sampler = self.sampler if self.sampler is not None else _random_sampling
+        return np.concatenate([sampler.samples(self.seed, pixel_ids, sample_indices, PIXEL_DIMENSION),
+                               sampler.samples(self.seed, pixel_ids, sample_indices, LENS_DIMENSION),
+                               sampler.samples(self.seed, pixel_ids, sample_indices, TIME_DIMENSION)[:, :1]], axis=1)
+
+    def bounce_samples(self, pixel_ids, sample_indices, depth, n_dimensions=2):
+        # (N, 2 * n_dimensions) first numbers of the bounce at the given depth, from n_dimensions 2D dimensions
+        sampler = self.sampler if self.sampler is not None and depth < self.sampled_bounces else _random_sampling
+        dimension = FIRST_BOUNCE_DIMENSION + BOUNCE_DIMENSIONS * depth
+        return np.concatenate([sampler.samples(self.seed, pixel_ids, sample_indices, dimension + offset)
+                               for offset in range(n_dimensions)], axis=1)
+
+    def path_samples(self, pixel_ids, sample_indices, max_depth):
+        """
+        returns the (N, n) first numbers of the RandomStream of every path: the camera numbers and, if there is a
+        sampler, the numbers of the first sampled_bounces bounces (up to max_depth). The stream hashes the rest
+        """
+        camera_samples = self.camera_samples(pixel_ids, sample_indices)
+        n_bounces = min(self.sampled_bounces, max_depth + 1)
+        if self.sampler is None or n_bounces <= 0:
+            return camera_samples
+        # the second number of the time dimension is not used
+        return np.concatenate([camera_samples, np.zeros((camera_samples.shape[0], 1))] +
+                              [self.bounce_samples(pixel_ids, sample_indices, depth, BOUNCE_DIMENSIONS)
+                               for depth in range(n_bounces)], axis=1)
+
+    def aov_channels(self):
+        # {name: n_channels} of the aovs written, as expected by the framebuffer
+        return {name: AOV_CHANNELS[name] for name in self.aovs}
+
+    def aov_buffers(self, n):
+        return {name: np.zeros((n, AOV_CHANNELS[name])) for name in self.aovs}
+
+    def primary_aovs(self, camera, directions, times, ts, points, normals, albedo, material_ids, velocities):
+        """
+        returns the aovs of N primary hits given as arrays, a dictionary {name: (N, n_channels)}
+        """
+        values = {}
+        for name in self.aovs:
+            if name == DEPTH:
+                values[name] = (ts * np.linalg.norm(directions, axis=1))[:, None]
+            elif name == NORMAL:
+                values[name] = normals
+            elif name == ALBEDO:
+                values[name] = albedo
+            elif name == MATERIAL_ID:
+                values[name] = np.asarray(material_ids, dtype=np.float64)[:, None]
+            elif name == POSITION:
+                values[name] = points
+            elif name == MOTION:
+                # move the hit point with its surface to the shutter open and close times
+                start = points + (camera.time_0 - times)[:, None] * velocities
+                end = points + (camera.time_1 - times)[:, None] * velocities
+                values[name] = (project(camera, end) - project(camera, start)) * np.array([self.width, self.height])
+        return values
+
+    def add_primary_aovs(self, buffers, idx, camera, ray, hit_record):
+        # adds the aovs of the primary hit of a sample of the pixel idx, nothing is added if the ray missed
+        if not buffers or hit_record is None:
+            return
+        velocity = hit_record.velocity if hit_record.velocity is not None else np.zeros(3)
+        albedo = np.asarray(getattr(hit_record.material, 'albedo', np.ones(3)), dtype=np.float64)
+        values = self.primary_aovs(camera, ray.direction[None], np.array([ray.time]), np.array([hit_record.t]),
+                                   hit_record.point[None], hit_record.normal[None], albedo[None],
+                                   np.array([hit_record.material_id]), np.asarray(velocity)[None])
+        for name, value in values.items():
+            buffers[name][idx] += value[0]
+
     def _get_color(self):
         raise NotImplementedError
 
@@ -12,4 +144,3 @@ class Integrator():
         for arg in args:
             yield [self.__class__.__name__, self.__dict__, name, arg]
 
-
@@ -0,0 +1,55 @@
+import numpy as np
+
+from core.samplers import bounce_number, ROULETTE_NUMBER
+from .integrator import sky_color
+from .path_tracer import PathTracer
+
+
+class IterativePathTracer(PathTracer):
+    """
+    Path tracer that follows every path in a loop keeping its throughput, the product of the attenuations
+    of the bounces so far, instead of recursing.
+
+    After rr_min_depth bounces the paths are terminated with Russian roulette: a path continues with
+    probability equal to the largest channel of its throughput (clamped to [rr_min_survival, 0.95]) and the
+    survivors are divided by that probability, so the estimate is unbiased. Paths that carry little energy,
+    like the ones bouncing between metals and glass, are stopped early instead of tracing up to max_depth rays.
+
+    The number of rays traced per sample (the average path length) is given by the render stats of Multithread.
+    """
+
+    def __init__(self, samples_per_pixel, width, height, max_depth=50, rr_min_depth=3, rr_min_survival=0.05, seed=0,
+                 sampler=None, aovs=()):
+        super().__init__(samples_per_pixel, width, height, max_depth, seed, sampler, aovs)
+        self.rr_min_depth = rr_min_depth
+        self.rr_min_survival = rr_min_survival
+
+    def _get_color(self, ray, world, rng):
+        color, throughput = np.zeros(3), np.ones(3)
+        for depth in range(self.max_depth + 1):
+            self.n_rays += 1
+            world_hit, hit_record = world.hit(ray, 0.001, float("inf"))  # intersect with the world
+            if depth == 0:
+                self.primary_hit = hit_record
+
+            if not world_hit:  # return background blue color
+                return color + throughput * sky_color(ray.direction)
+
+            # absorbed paths and paths that reach max_depth only get the emitted light
+            color += throughput * hit_record.material.emitted()
+            rng.dim = bounce_number(depth)
+            is_scattered, scattered, attenuation = hit_record.material.scatter(ray, hit_record, rng)
+            if depth == self.max_depth or not is_scattered:
+                break
+            throughput = throughput * attenuation
+            ray = scattered
+
+            # russian roulette, the survivors are reweighted by their probability of surviving
+            if depth + 1 >= self.rr_min_depth:
+                survival = min(max(throughput.max(), self.rr_min_survival), 0.95)
+                rng.dim = bounce_number(depth, ROULETTE_NUMBER)
+                if rng.next() >= survival:
+                    break
+                throughput = throughput / survival
+
+        return color
@@ -0,0 +1,92 @@
+import numpy as np
+
+from core.ray import Ray
+from core.samplers import bounce_number, ROULETTE_NUMBER, LIGHT_NUMBER
+from core.vec_utils import unit_vector
+from geometries import SphereLights
+from .integrator import sky_color
+from .iterative import IterativePathTracer
+
+
+class MISPathTracer(IterativePathTracer):
+    """
+    Iterative path tracer with next event estimation: at every non specular hit a light of the scene (see
+    SphereLights) is sampled and a shadow ray is traced towards it. The light reached by sampling the light
+    and the one reached by scattering are combined with multiple importance sampling (power heuristic), so
+    both small and large lights converge quickly.
+
+    The sky is only reached by scattering, and specular materials (Metal, Dielectric) are not light sampled.
+    The world must support the occluded query.
+    """
+
+    def render(self, cols, rows, camera, world, reporter=None):
+        self.lights = SphereLights.from_world(world)
+        return super().render(cols, rows, camera, world, reporter)
+
+    def _get_color(self, ray, world, rng):
+        color, throughput = np.zeros(3), np.ones(3)
+        specular, scatter_pdf, last_point = True, 0., None  # camera rays are handled as specular bounces
+        for depth in range(self.max_depth + 1):
+            self.n_rays += 1
+            world_hit, hit_record = world.hit(ray, 0.001, float("inf"))  # intersect with the world
+            if depth == 0:
+                self.primary_hit = hit_record
+
+            if not world_hit:  # return background blue color
+                return color + throughput * sky_color(ray.direction)
+
+            # light found by scattering, weighted against sampling it from the previous hit
+            material = hit_record.material
+            emitted = material.emitted()
+            if np.any(emitted > 0.):
+                weight = 1.
+                if not specular:
+                    light_pdf = self.lights.pdf(last_point, unit_vector(ray.direction), ray.time)
+                    weight = _power_heuristic(scatter_pdf, light_pdf)
+                color += throughput * weight * emitted
+
+            if not material.is_specular and len(self.lights) > 0:
+                rng.dim = bounce_number(depth, LIGHT_NUMBER)
+                color += throughput * self._sample_light(ray, hit_record, world, rng)
+
+            # absorbed paths and paths that reach max_depth end here
+            rng.dim = bounce_number(depth)
+            is_scattered, scattered, attenuation = material.scatter(ray, hit_record, rng)
+            if depth == self.max_depth or not is_scattered:
+                break
+            specular = material.is_specular
+            if not specular:
+                _, scatter_pdf = material.scattering(ray, hit_record, scattered.direction)
+            last_point = hit_record.point
+            throughput = throughput * attenuation
+            ray = scattered
+
+            # russian roulette, the survivors are reweighted by their probability of surviving
+            if depth + 1 >= self.rr_min_depth:
+                survival = min(max(throughput.max(), self.rr_min_survival), 0.95)
+                rng.dim = bounce_number(depth, ROULETTE_NUMBER)
+                if rng.next() >= survival:
+                    break
+                throughput = throughput / survival
+
+        return color
+
+    def _sample_light(self, ray, hit_record, world, rng):
+        # next event estimation, light arriving to the hit from a sampled light weighted against scattering
+        u_light, u_0, u_1 = rng.next(), rng.next(), rng.next()
+        direction, distance, emit, light_pdf = self.lights.sample(hit_record.point, ray.time, u_light, u_0, u_1)
+        if light_pdf <= 0.:
+            return np.zeros(3)
+
+        value, scatter_pdf = hit_record.material.scattering(ray, hit_record, direction)
+        if scatter_pdf <= 0.:
+            return np.zeros(3)
+
+        self.n_rays += 1
+        if world.occluded(Ray(hit_record.point, direction, ray.time), 0.001, distance - 0.001):
+            return np.zeros(3)
+        return value * emit * _power_heuristic(light_pdf, scatter_pdf) / light_pdf
+
+
+def _power_heuristic(pdf, other_pdf):
+    return pdf ** 2 / (pdf ** 2 + other_pdf ** 2)
@@ -1,31 +1,39 @@
-import random
-from multiprocessing import Value
-
 import numpy as np
-from tqdm import tqdm
-
-from core.vec_utils import unit_vector
-from .integrator import Integrator
-
-rand = random.random
-
-global pbar, pbar_update
 
-pbar_update = Value('i', 0)  # create a value to track progress
+from core.rng import RandomStream
+from core.samplers import bounce_number
+from films import SQUARED_LUMINANCE, LUMINANCE_WEIGHTS
+from .integrator import Integrator, sky_color
 
 
 class PathTracer(Integrator):
-    def __init__(self, samples_per_pixel, width, height):
-        global pbar
+    """
+    Recursive path tracer. render runs the sample loop of every pixel and _get_color gives the radiance of a
+    camera ray, the other scalar path tracers (IterativePathTracer, MISPathTracer) only override _get_color.
+    """
 
+    def __init__(self, samples_per_pixel, width, height, max_depth=50, seed=0, sampler=None, aovs=()):
         self.samples_per_pixel = samples_per_pixel
         self.height = height
         self.width = width
-        pbar = tqdm(total=(width * height))
-
-    def run(self, cols, rows, get_ray, world):
-        global pbar, pbar_update
+        self.max_depth = max_depth
+        self.seed = seed
+        self.sampler = sampler
+        self.aovs = tuple(aovs)
+        self.primary_hit = None  # hit record of the camera ray of the last sample, None if it missed
+        self.n_rays = 0  # rays traced by this process
+
+    def render(self, cols, rows, camera, world, reporter=None):
         color_values = np.zeros((*cols.shape, 3))
+        squared_luminance = np.zeros(cols.shape)  # used by the film to estimate the variance
+        aovs = self.aov_buffers(cols.shape[0])
+        pixel_ids = self.pixel_ids(cols, rows)
+
+        # first numbers of the paths of all the samples of the tile, (pixels, samples, n)
+        samples = self.sample_offset + np.arange(self.samples_per_pixel)
+        path_samples = self.path_samples(np.repeat(pixel_ids, self.samples_per_pixel),
+                                         np.tile(samples, cols.shape[0]), self.max_depth)
+        path_samples = path_samples.reshape((cols.shape[0], self.samples_per_pixel, -1))
 
         for idx in range(cols.shape[0]):
             row, col = rows[idx], cols[idx]
@@ -33,44 +41,49 @@ class PathTracer(Integrator):
             color = np.zeros(3)
 
             # antialiasing by sampling multiple times in the same pixel
+            n_rays = self.n_rays
             for s in range(self.samples_per_pixel):
-                u = (col + rand()) / self.width
-                v = (row + rand()) / self.height
+                rng = RandomStream(self.seed, pixel_ids[idx], samples[s], 0, path_samples[idx, s])
+                u = (col + rng.next()) / self.width
+                v = (row + rng.next()) / self.height
 
                 # trace ray
-                ray = get_ray(u, v)
+                ray = camera.get_ray(u, v, rng)
 
                 # get color of the intersected objects
-                color += self._get_color(ray, world, depth=0, max_depth=50)
+                sample_color = self._get_color(ray, world, rng)
+                self.add_primary_aovs(aovs, idx, camera, ray, self.primary_hit)
+                color += sample_color
+                squared_luminance[idx] += np.dot(sample_color, LUMINANCE_WEIGHTS) ** 2
 
-            # normalize color for the number of samples and store it
-            color_values[idx] = np.sqrt(color / self.samples_per_pixel)
+            # store the accumulated color, it is normalized by the film
+            color_values[idx] = color
 
-            # update progress bar
-            with pbar_update.get_lock():
-                pbar_update.value += 1
-                pbar.n = pbar_update.value
-                pbar.refresh()
+            # report progress, the reporter only shares it every few pixels
+            if reporter is not None:
+                reporter.update(pixels=1, samples=self.samples_per_pixel, rays=self.n_rays - n_rays)
 
-        return color_values, rows, cols
+        aovs[SQUARED_LUMINANCE] = squared_luminance
+        return color_values, np.full(cols.shape, self.samples_per_pixel), aovs
 
-    def _get_color(self, ray, world, depth, max_depth=50):
+    def _get_color(self, ray, world, rng, depth=0):
+        self.n_rays += 1
         world_hit, hit_record = world.hit(ray, 0.001, float("inf"))  # intersect with the world
+        if depth == 0:
+            self.primary_hit = hit_record
 
         if world_hit:  # run if there was a hit
             # check if the ray is absorved or scattered
-            is_scattered = hit_record.material.scatter(ray, hit_record)
+            rng.dim = bounce_number(depth)
+            is_scattered, scattered, attenuation = hit_record.material.scatter(ray, hit_record, rng)
+            emitted = hit_record.material.emitted()
 
             # if it is scattered and we have scattered less than max_depth times
             # get the scattered ray and obtain its color
-            if depth < max_depth and is_scattered:
-                scattered = hit_record.material.scattered
-                attenuation = hit_record.material.attenuation
-
-                return attenuation * self._get_color(scattered, world, depth + 1, max_depth)
+            if depth < self.max_depth and is_scattered:
+                return emitted + attenuation * self._get_color(scattered, world, rng, depth + 1)
             else:
-                return np.zeros(3)  # if it did not scatter, return a black pixel
+                return emitted  # if it did not scatter, only the emitted light
 
         else:  # return background blue color
-            t = 0.5 * (unit_vector(ray.direction)[1] + 1.)
-            return (1. - t) * np.ones(3) + t * np.array([0.5, 0.7, 1.])
+            return sky_color(ray.direction)
@@ -0,0 +1,136 @@
+import numpy as np
+
+from films import SQUARED_LUMINANCE, luminance
+from materials import MaterialTable
+from .integrator import Integrator, sky_color_batch
+
+
+class WavefrontPathTracer(Integrator):
+    """
+    Batched path tracer.
+
+    Instead of following one path at a time, all the camera rays of a tile are generated and then
+    processed in stages for each bounce:
+        1. intersect all the alive rays with the world
+        2. add the sky color of the rays that missed and the light emitted by the surfaces hit
+        3. scatter the hits sorted by material type, with one scatter_batch call per type
+        4. compact away the paths that were absorbed
+
+    All the path data is held in NumPy arrays. batch_size is the number of paths processed together,
+    larger batches amortize the per-stage overhead at the cost of memory.
+
+    The world needs to provide hit_batch, surface_batch and velocity_batch (LinearBVH and SphereSet do).
+    The camera and bounce numbers of all the paths are drawn at once from the sampler, and the camera rays
+    of a batch are generated with a single Camera.get_rays call.
+    """
+
+    def __init__(self, samples_per_pixel, width, height, batch_size=4096, max_depth=50, seed=0, sampler=None,
+                 aovs=()):
+        self.samples_per_pixel = samples_per_pixel
+        self.height = height
+        self.width = width
+        self.seed = seed
+        self.sampler = sampler
+        self.batch_size = batch_size
+        self.max_depth = max_depth
+        self.aovs = tuple(aovs)
+        self.n_rays = 0  # rays traced by this process
+
+    def render(self, cols, rows, camera, world, reporter=None):
+        material_table = MaterialTable(world.materials)
+
+        # one path per sample, each path keeps the index of its pixel
+        path_pixels = np.repeat(np.arange(cols.shape[0]), self.samples_per_pixel)
+        path_samples = self.sample_offset + np.tile(np.arange(self.samples_per_pixel), cols.shape[0])
+        pixel_ids = self.pixel_ids(cols, rows)
+        color_values = np.zeros((*cols.shape, 3))
+        squared_luminance = np.zeros(cols.shape)  # used by the film to estimate the variance
+        aovs = self.aov_buffers(cols.shape[0])
+        reporter_pixels, n_rays = 0, self.n_rays
+
+        for start in range(0, path_pixels.shape[0], self.batch_size):
+            pixels = path_pixels[start:start + self.batch_size]
+            keys = pixel_ids[pixels], path_samples[start:start + self.batch_size]
+            origins, directions, times = self._camera_rays(cols[pixels], rows[pixels], keys, camera)
+            colors, path_aovs = self._trace(origins, directions, times, keys, camera, world, material_table)
+            np.add.at(color_values, pixels, colors)
+            for name, values in path_aovs.items():
+                np.add.at(aovs[name], pixels, values)
+            np.add.at(squared_luminance, pixels, luminance(colors) ** 2)
+
+            # report progress once per batch
+            if reporter is not None:
+                finished = (start + pixels.shape[0]) // self.samples_per_pixel  # pixels with all their samples
+                reporter.update(pixels=finished - reporter_pixels, samples=pixels.shape[0],
+                                rays=self.n_rays - n_rays)
+                reporter_pixels, n_rays = finished, self.n_rays
+
+        aovs[SQUARED_LUMINANCE] = squared_luminance
+        return color_values, np.full(cols.shape, self.samples_per_pixel), aovs
+
+    def _camera_rays(self, cols, rows, keys, camera):
+        # antialiasing by jittering every sample inside its pixel, the lens and time numbers follow the jitter
+        pixel_ids, samples = keys
+        camera_samples = self.camera_samples(pixel_ids, samples)
+        us = (cols + camera_samples[:, 0]) / self.width
+        vs = (rows + camera_samples[:, 1]) / self.height
+        return camera.get_rays(us, vs, np.ascontiguousarray(camera_samples[:, 2:4]),
+                               np.ascontiguousarray(camera_samples[:, 4]))
+
+    def _trace(self, origins, directions, times, keys, camera, world, material_table):
+        colors = np.zeros((origins.shape[0], 3))
+        aovs = self.aov_buffers(origins.shape[0])  # written at the primary hits
+        throughput = np.ones((origins.shape[0], 3))
+        paths = np.arange(origins.shape[0])  # index in colors of every alive path
+
+        for depth in range(self.max_depth + 1):
+            # intersect all the alive rays
+            prims, ts = world.hit_batch(origins, directions, times, 0.001, np.inf)
+            self.n_rays += origins.shape[0]
+
+            # rays that missed get the background blue color
+            missed = prims < 0
+            colors[paths[missed]] += throughput[missed] * sky_color_batch(directions[missed])
+
+            # keep only the rays that hit something
+            hit = ~missed
+            if not np.any(hit):
+                break
+            origins, directions, times = origins[hit], directions[hit], times[hit]
+            paths, throughput, prims, ts = paths[hit], throughput[hit], prims[hit], ts[hit]
+
+            # paths that reach max_depth only get the emitted light, as in PathTracer
+            points, normals, material_ids = world.surface_batch(prims, origins, directions, times, ts)
+            colors[paths] += throughput * material_table.emit[material_ids]
+            if depth == self.max_depth:
+                break
+            if depth == 0 and aovs:
+                values = self.primary_aovs(camera, directions, times, ts, points, normals,
+                                           material_table.albedo[material_ids], material_ids,
+                                           world.velocity_batch(prims))
+                for name, value in values.items():
+                    aovs[name][paths] = value
+
+            # shade the hits sorted by material type, with the random numbers of this bounce
+            pixel_ids, samples = keys
+            random = self.bounce_samples(pixel_ids[paths], samples[paths], depth)
+            front_face = np.sum(directions * normals, axis=1) < 0.
+            order = np.argsort(material_table.type_ids[material_ids], kind='stable')
+            type_ids = material_table.type_ids[material_ids[order]]
+            alive = np.zeros(paths.shape[0], dtype=bool)
+            new_origins, new_directions = np.zeros_like(origins), np.zeros_like(directions)
+            attenuation = np.ones_like(throughput)
+            for type_id in np.unique(type_ids):
+                hits = order[np.searchsorted(type_ids, type_id):np.searchsorted(type_ids, type_id, side='right')]
+                material = material_table.gather(type_id, material_ids[hits])
+                new_origins[hits], new_directions[hits], attenuation[hits], alive[hits] = material.scatter_batch(
+                    directions[hits], points[hits], normals[hits], front_face[hits], random[hits])
+
+            # compact away the absorbed paths
+            origins, directions, times = new_origins[alive], new_directions[alive], times[alive]
+            paths, throughput = paths[alive], throughput[alive] * attenuation[alive]
+            if paths.shape[0] == 0:
+                break
+
+        return colors, aovs
+
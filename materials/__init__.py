@@ -1,3 +1,5 @@
 from .lambertian import *
 from .metal import *
 from .dielectric import *
+from .diffuse_light import DiffuseLight
+from .material_table import MaterialTable
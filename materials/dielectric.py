@@ -1,5 +1,4 @@
 import math
-import random
 
 import numba as nb
 import numpy as np
@@ -7,23 +6,21 @@ import numpy as np
 from core import Ray
 from core.vec_utils import length
 from materials import Material
-from .utils import reflect, refract
+from .utils import reflect, refract, reflect_batch, per_hit
 
 # spec = [
 #     ('refraction_index', nb.float64),
-#     ('scattered', Ray.class_type.instance_type),
-#     ('attenuation', nb.float64[:]),
 # ]
 
 
 # @nb.jitclass(spec)
 class Dielectric(Material):
+    type_id = 2
 
     def __init__(self, refraction_index):
         self.refraction_index = refraction_index
-        self.attenuation = np.ones(1)
 
-    def scatter(self, ray, hit_record):
+    def scatter(self, ray, hit_record, rng):
         reflected = reflect(ray.direction, hit_record.normal)
 
         # If the ray is inside the sphere set values accordingly
@@ -42,12 +39,39 @@ class Dielectric(Material):
         reflect_prob = self._schlick(cosine) if is_refracted else 1
 
         # set the scattered ray as either the reflection or refraction according to reflect_prob
-        if random.random() < reflect_prob:
-            self.scattered = Ray(hit_record.point, reflected, ray.time)
+        if rng.next() < reflect_prob:
+            scattered = Ray(hit_record.point, reflected, ray.time)
         else:
-            self.scattered = Ray(hit_record.point, refracted, ray.time)
+            scattered = Ray(hit_record.point, refracted, ray.time)
 
-        return True
+        return True, scattered, np.ones(3)
+
+    def scatter_batch(self, directions, points, normals, front_face, rng):
+        n = directions.shape[0]
+        refraction_index = per_hit(self.refraction_index, n)
+        lengths = np.linalg.norm(directions, axis=1)
+        dot = np.sum(directions * normals, axis=1)
+
+        # If the ray is inside the sphere set values accordingly
+        outward_normals = np.where(front_face[:, None], normals, -normals)
+        ni_over_nt = np.where(front_face, 1. / refraction_index, refraction_index)
+        cosine = np.where(front_face, -dot / lengths, refraction_index * dot / lengths)
+
+        # refraction
+        unit_directions = directions / lengths[:, None]
+        dt = np.sum(unit_directions * outward_normals, axis=1)
+        discriminant = 1. - ni_over_nt ** 2 * (1 - dt ** 2)
+        is_refracted = discriminant > 0
+        refracted = ni_over_nt[:, None] * (unit_directions - outward_normals * dt[:, None]) - \
+                    outward_normals * np.sqrt(np.maximum(discriminant, 0.))[:, None]
+
+        # get probability of reflection over refraction with schlick approximation
+        r0 = ((1 - refraction_index) / (1 + refraction_index)) ** 2
+        reflect_prob = np.where(is_refracted, r0 + (1 - r0) * (1 - cosine) ** 5, 1.)
+
+        is_reflected = rng[:, 0] < reflect_prob
+        new_directions = np.where(is_reflected[:, None], reflect_batch(directions, normals), refracted)
+        return points, new_directions, np.ones((n, 3)), np.ones(n, dtype=bool)
 
     def _schlick(self, cosine):
         """
@@ -0,0 +1,23 @@
+import numpy as np
+
+from .material import Material
+
+
+class DiffuseLight(Material):
+    """
+    Emissive material, it emits the radiance emit in every direction and does not scatter light
+    """
+    type_id = 3
+
+    def __init__(self, emit):
+        self.emit = np.array(emit, dtype=np.float64)
+
+    def emitted(self):
+        return self.emit
+
+    def scatter(self, ray, hit_record, rng):
+        return False, None, np.zeros(3)
+
+    def scatter_batch(self, directions, points, normals, front_face, rng):
+        n = directions.shape[0]
+        return points, directions, np.zeros((n, 3)), np.zeros(n, dtype=bool)
@@ -0,0 +1,86 @@
+"""
+Compiled scatter of the materials stored in a MaterialTable.
+
+The kernels take the material parameters as the arrays of the table and dispatch on the type id of the
+material, so they can be called from nopython code with a HitRecord instead of a material object.
+They draw their random numbers from the RandomStream in the same order as the scatter methods of the
+material classes.
+"""
+
+import math
+
+import numba as nb
+import numpy as np
+
+from core.ray import Ray
+from core.vec_utils import random_in_unit_sphere, unit_vector, length
+from .lambertian import Lambertian
+from .metal import Metal
+from .dielectric import Dielectric
+from .diffuse_light import DiffuseLight
+
+LAMBERTIAN = Lambertian.type_id
+METAL = Metal.type_id
+DIELECTRIC = Dielectric.type_id
+DIFFUSE_LIGHT = DiffuseLight.type_id
+
+
+@nb.jit(nopython=True)
+def _reflect(vec, normal):
+    return vec - 2 * np.dot(vec, normal) * normal
+
+
+@nb.jit(nopython=True)
+def scatter(ray, hit_record, rng, type_ids, albedo, fuzzy, refraction_index):
+    """
+    scatters the ray at the hit_record with the material hit_record.material_id of a MaterialTable given by
+    its arrays. Returns if the ray is scattered, the scattered ray and the attenuation
+    """
+    material_id = hit_record.material_id
+    type_id = type_ids[material_id]
+
+    if type_id == LAMBERTIAN:
+        direction = hit_record.normal + random_in_unit_sphere(rng)
+        return True, Ray(hit_record.point, direction, ray.time), albedo[material_id]
+
+    if type_id == METAL:
+        reflected = _reflect(unit_vector(ray.direction), hit_record.normal)
+        direction = reflected + fuzzy[material_id] * random_in_unit_sphere(rng)
+        return np.dot(direction, hit_record.normal) > 0., Ray(hit_record.point, direction, ray.time), \
+            albedo[material_id]
+
+    if type_id == DIFFUSE_LIGHT:
+        return False, ray, np.zeros(3)
+
+    return _scatter_dielectric(ray, hit_record, rng, refraction_index[material_id])
+
+
+@nb.jit(nopython=True)
+def _scatter_dielectric(ray, hit_record, rng, refraction_index):
+    dot = np.dot(ray.direction, hit_record.normal)
+
+    # If the ray is inside the sphere set values accordingly
+    if dot > 0.:
+        outward_normal = -hit_record.normal
+        ni_over_nt = refraction_index
+        cosine = refraction_index * dot / length(ray.direction)
+    else:
+        outward_normal = hit_record.normal
+        ni_over_nt = 1. / refraction_index
+        cosine = -dot / length(ray.direction)
+
+    # refraction, the reflection probability is 1 on total internal reflection
+    unit_direction = unit_vector(ray.direction)
+    dt = np.dot(unit_direction, outward_normal)
+    discriminant = 1. - ni_over_nt ** 2 * (1 - dt ** 2)
+    reflect_prob = 1.
+    if discriminant > 0:
+        # get probability of reflection over refraction with schlick approximation
+        r0 = ((1 - refraction_index) / (1 + refraction_index)) ** 2
+        reflect_prob = r0 + (1 - r0) * math.pow(1 - cosine, 5)
+
+    if rng.next() < reflect_prob:
+        direction = _reflect(ray.direction, hit_record.normal)
+    else:
+        direction = ni_over_nt * (unit_direction - outward_normal * dt) - outward_normal * math.sqrt(discriminant)
+    return True, Ray(hit_record.point, direction, ray.time), np.ones(3)
@@ -2,27 +2,40 @@ import numba as nb
 import numpy as np
 
 from core.ray import Ray
-from core.vec_utils import random_in_unit_sphere
+from core.vec_utils import random_in_unit_sphere, uniform_in_sphere_batch, unit_vector
 from .material import Material
+from .utils import per_hit
 
 # spec = [
 #     ('albedo', nb.float64[:]),
-#     ('scattered', Ray.class_type.instance_type),
-#     ('attenuation', nb.float64[:]),
 # ]
 
 
 # @nb.jitclass(spec)
 class Lambertian(Material):
+    type_id = 0
+    is_specular = False
+
     def __init__(self, albedo):
         self.albedo = albedo
 
-    def scatter(self, ray, hit_record):
-        target = hit_record.point + hit_record.normal + random_in_unit_sphere()
-        self.scattered = Ray(hit_record.point, target - hit_record.point, ray.time)
-        self.attenuation = self.albedo
+    def scatter(self, ray, hit_record, rng):
+        target = hit_record.point + hit_record.normal + random_in_unit_sphere(rng)
+        scattered = Ray(hit_record.point, target - hit_record.point, ray.time)
+
+        return True, scattered, self.albedo
+
+    def scattering(self, ray, hit_record, direction):
+        # the directions normal + random point in the unit sphere have pdf 2 cos^3 / pi, scatter weights them
+        # by albedo so the BSDF times the cosine is albedo * pdf
+        cosine = np.dot(unit_vector(direction), hit_record.normal)
+        pdf = 2. * cosine ** 3 / np.pi if cosine > 0. else 0.
+        return np.asarray(self.albedo) * pdf, pdf
 
-        return True
+    def scatter_batch(self, directions, points, normals, front_face, rng):
+        n = directions.shape[0]
+        new_directions = normals + uniform_in_sphere_batch(rng)
+        return points, new_directions, per_hit(self.albedo, n, ndim=1), np.ones(n, dtype=bool)
 
     @staticmethod
     def reflect(ray_in, normal):
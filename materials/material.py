@@ -1,12 +1,43 @@
 import numba as nb
+import numpy as np
 
 spec = []
 
 
 # @nb.jitclass(spec)
 class Material(object):
+    type_id = -1  # id of the material type in a MaterialTable
+    is_specular = True  # the scattered directions can not be evaluated with scattering, no light sampling
+
     def __init__(self):
         pass
 
-    def scatter(self, ray_in, hit_record):
+    def scatter(self, ray_in, hit_record, rng):
+        """
+        rng is the RandomStream of the sample being traced.
+        Returns if the ray is scattered, the scattered ray and the attenuation, the material is not modified
+        """
+        raise NotImplementedError()
+
+    def emitted(self):
+        # radiance emitted by the surface
+        return np.zeros(3)
+
+    def scattering(self, ray, hit_record, direction):
+        """
+        returns the attenuation times the cosine for light arriving from direction (the BSDF times the cosine)
+        and the solid angle pdf of scatter sampling that direction. Only for materials that are not specular
+        """
+        raise NotImplementedError()
+
+    def scatter_batch(self, directions, points, normals, front_face, rng):
+        """
+        scatters N hits of rays with (N, 3) directions at (N, 3) points with outward (N, 3) normals. front_face is
+        True for the rays that hit the surface from outside and rng the (N, 4) uniform numbers of the bounce.
+        Returns the (N, 3) new origins and directions, the (N, 3) attenuation and the (N,) mask of the rays that
+        were not absorbed.
+
+        The parameters of the material can also be arrays with a value per hit (see MaterialTable.gather), so
+        the hits of several materials of the same type are scattered together
+        """
         raise NotImplementedError()
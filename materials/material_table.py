@@ -0,0 +1,54 @@
+import copy
+
+import numpy as np
+
+_PARAMETERS = ('albedo', 'fuzzy', 'refraction_index', 'emit')
+
+
+class MaterialTable(object):
+    """
+    Parameters of a list of materials stored as arrays indexed by material id.
+
+        - type_ids: (M,) int32, the type_id of the material class
+        - albedo: (M, 3) float64, Lambertian and Metal albedo
+        - fuzzy: (M,) float64, Metal fuzziness
+        - refraction_index: (M,) float64, Dielectric refraction index
+        - emit: (M, 3) float64, DiffuseLight emitted radiance
+
+    Parameters that do not apply to a material type are left at their default value.
+    gather builds a material with the parameters of many materials of the same type, used to scatter their
+    hits in a single scatter_batch call.
+    """
+
+    def __init__(self, materials):
+        n = len(materials)
+        self.type_ids = np.zeros(n, dtype=np.int32)
+        self.albedo = np.ones((n, 3))
+        self.fuzzy = np.zeros(n)
+        self.refraction_index = np.ones(n)
+        self.emit = np.zeros((n, 3))
+        self.prototypes = {}  # a material of every type in the table
+
+        for idx, material in enumerate(materials):
+            if material.type_id < 0:
+                raise Exception('Material %s can not be stored in a MaterialTable' % material.__class__.__name__)
+            self.type_ids[idx] = material.type_id
+            self.prototypes.setdefault(material.type_id, material)
+
+            for parameter in _PARAMETERS:
+                if hasattr(material, parameter):
+                    getattr(self, parameter)[idx] = getattr(material, parameter)
+
+    def gather(self, type_id, material_ids):
+        """
+        returns a material of type type_id whose parameters are arrays with the values of the materials
+        material_ids, all of them of that type
+        """
+        material = copy.copy(self.prototypes[type_id])
+        for parameter in _PARAMETERS:
+            if hasattr(material, parameter):
+                setattr(material, parameter, getattr(self, parameter)[material_ids])
+        return material
+
+    def __len__(self):
+        return len(self.type_ids)
@@ -2,27 +2,34 @@ import numba as nb
 import numpy as np
 
 from core.ray import Ray
-from core.vec_utils import random_in_unit_sphere, unit_vector
+from core.vec_utils import random_in_unit_sphere, uniform_in_sphere_batch, unit_vector
 from .material import Material
-from .utils import reflect
+from .utils import reflect, reflect_batch, per_hit
 
 # spec = [
 #     ('albedo', nb.float64[:]),
 #     ('fuzzy', nb.float64),
-#     ('scattered', Ray.class_type.instance_type),
-#     ('attenuation', nb.float64[:]),
 # ]
 
 
 # @nb.jitclass(spec)
 class Metal(Material):
+    type_id = 1
+
     def __init__(self, albedo, fuzzy):
         self.albedo = np.array(albedo)
         self.fuzzy = fuzzy
 
-    def scatter(self, ray, hit_record):
+    def scatter(self, ray, hit_record, rng):
         reflected = reflect(unit_vector(ray.direction), hit_record.normal)
-        self.scattered = Ray(hit_record.point, reflected + self.fuzzy * random_in_unit_sphere(), ray.time)
-        self.attenuation = self.albedo
+        scattered = Ray(hit_record.point, reflected + self.fuzzy * random_in_unit_sphere(rng), ray.time)
+
+        return np.dot(scattered.direction, hit_record.normal) > 0., scattered, self.albedo
 
-        return np.dot(self.scattered.direction, hit_record.normal) > 0.
+    def scatter_batch(self, directions, points, normals, front_face, rng):
+        n = directions.shape[0]
+        unit_directions = directions / np.linalg.norm(directions, axis=1)[:, None]
+        new_directions = reflect_batch(unit_directions, normals) + \
+                         per_hit(self.fuzzy, n)[:, None] * uniform_in_sphere_batch(rng)
+        alive = np.sum(new_directions * normals, axis=1) > 0.
+        return points, new_directions, per_hit(self.albedo, n, ndim=1), alive
@@ -16,3 +16,19 @@ def refract(vec, normal, ni_over_nt):
         refracted = ni_over_nt * (unit_v - normal * dt) - normal * math.sqrt(discriminant)
         return True, refracted
     return False, None
+
+
+def reflect_batch(vectors, normals):
+    # reflect (N, 3) vectors about (N, 3) normals
+    return vectors - 2 * np.sum(vectors * normals, axis=1)[:, None] * normals
+
+
+def per_hit(parameter, n, ndim=0):
+    """
+    returns a material parameter as a (n, ...) array. The parameter is either the value of a single material,
+    with ndim dimensions, that is broadcast to the n hits or an array with a value per hit
+    """
+    parameter = np.asarray(parameter, dtype=np.float64)
+    if parameter.ndim == ndim:
+        return np.broadcast_to(parameter, (n,) + parameter.shape)
+    return parameter
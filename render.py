@@ -1,13 +1,13 @@
 import random
 
 import numpy as np
-from matplotlib import pyplot as plt
 
 from core import Camera, Multithread
+from films import Denoiser, HDRfilm, LDRfilm, write_png, DEPTH, NORMAL, ALBEDO
 from integrators import PathTracer
 from scenes import moving_spheres
 
-# set random seed for reproducibility
+# set random seed for reproducibility of the scene, the render is seeded through the integrator
 random.seed(123456)
 rand = random.random
 
@@ -20,6 +20,28 @@ out_name = 'pruebas_bvh'  # outfile image name
 
 samples_per_pixel = 1  # number samples per pixel
 
+# adaptive sampling, pixels are sampled in rounds of samples_per_pixel until their relative error is
+# below adaptive_threshold or they reach max_samples_per_pixel. Set to None to take samples_per_pixel samples
+adaptive_threshold = None
+max_samples_per_pixel = 256
+
+# progressive rendering, the image is rendered in passes of samples_per_pixel samples and checkpointed to
+# images/<out_name>_checkpoint.npy/.json, running again resumes from the checkpoint. Set to None for a single pass
+progressive_passes = None
+
+# time budget in seconds, passes of samples_per_pixel samples are rendered until it runs out. None to disable
+time_budget = None
+
+# outputs of the primary hit written with the radiance, for example ('depth', 'normal'), see films.AOV_CHANNELS
+aovs = ()
+
+# strength of the denoiser applied to the final image, it adds the depth, normal and albedo aovs. None to disable
+denoise_strength = None
+
+# tone mapping of the png output, the linear radiance is also written to images/<out_name>.pfm as tiles finish
+exposure = 1.
+tonemap_operator = None  # None, 'reinhard' or 'aces'
+
 # canvas properties
 width = 120
 height = 80
@@ -41,23 +63,40 @@ def main():
     world = moving_spheres()
 
     # set integrator
-    integrator = PathTracer(samples_per_pixel, width, height)
+    guides = (DEPTH, NORMAL, ALBEDO) if denoise_strength is not None else ()
+    integrator = PathTracer(samples_per_pixel, width, height, seed=123456,
+                            aovs=tuple(aovs) + tuple(name for name in guides if name not in aovs))
+    # integrator = CompiledPathTracer(samples_per_pixel, width, height, seed=123456)
+    # integrator = MISPathTracer(samples_per_pixel, width, height, seed=123456)
     # integrator = Depth(width, height)
     # integrator = SurfaceNormal(width, height)
 
     # start rendering process
     multithread = Multithread(camera, world, n_cores)  # create object to handle multithreading
-    multithread.create_working_pool(width, height)  # create the pool of pixels for each thread
-    multithread.run(integrator)
+    # create the pool of pixels for each thread and the framebuffer with the aovs of the integrator
+    multithread.create_working_pool(width, height, aovs=integrator.aov_channels())
+    # the film streams the finished tiles of the framebuffer to the pfm file
+    film = HDRfilm(width, height, 'images/' + out_name + '.pfm')
+    if time_budget is not None:
+        multithread.run_budget(integrator, time_budget)
+    elif progressive_passes is not None:
+        multithread.run_progressive(integrator, progressive_passes, 'images/' + out_name + '_checkpoint')
+    elif adaptive_threshold is None:
+        multithread.run(integrator, on_tile=lambda tile_idx: film.update_tile(multithread.tiles[tile_idx],
+                                                                              multithread.framebuffer))
+    else:
+        multithread.run_adaptive(integrator, adaptive_threshold, max_samples_per_pixel)
+        counts = multithread.sample_count_image()
+        write_png('images/' + out_name + '_samples.png', counts / max(counts.max(), 1.))
 
     # store output image
-    # todo change this into a FILM class
-    plt.figure()
-    plt.axis('equal')
-    plt.imshow(multithread.out_img, origin='lower')
-    plt.axis('off')
-    plt.show()
-    plt.imsave('images/' + out_name + '.png', multithread.out_img, origin='lower')
+    film.update(multithread.framebuffer)
+    if denoise_strength is not None:
+        film.replace(Denoiser(denoise_strength).denoise_framebuffer(multithread.framebuffer))
+    film.write_png('images/' + out_name + '.png', LDRfilm(exposure, operator=tonemap_operator))
+    film.close()
+
+    multithread.close()  # stop the workers and free the framebuffer
 
 
 if __name__ == '__main__':
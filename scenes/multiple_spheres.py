@@ -1,14 +1,33 @@
 import random
-from core import BVH_node
+from core import BVH_node, LinearBVH
 import numpy as np
 
-from geometries import MovingSphere, Sphere, HitableList
+from geometries import MovingSphere, Sphere, HitableList, SphereSet
 from materials import Lambertian, Dielectric, Metal
 
 rand = random.random
 
 
-def spheres():
+def build_world(world, time0, time1, accelerator='linear_bvh', bvh_strategy='sah'):
+    """
+    builds the list of hitables into the structure used to intersect the scene:
+        - 'linear_bvh': flattened BVH (LinearBVH)
+        - 'bvh': tree of BVH_node objects
+        - 'sphere_set': all the spheres in a SphereSet, intersected by brute force in a single kernel
+        - 'list': HitableList
+    """
+    if accelerator == 'linear_bvh':
+        return LinearBVH(BVH_node(world, time0, time1, strategy=bvh_strategy))
+    elif accelerator == 'bvh':
+        return BVH_node(world, time0, time1, strategy=bvh_strategy)
+    elif accelerator == 'sphere_set':
+        return SphereSet.from_hitables(world)
+    elif accelerator == 'list':
+        return HitableList(world)
+    raise Exception('Unknown accelerator: %s' % accelerator)
+
+
+def spheres(accelerator='linear_bvh', bvh_strategy='sah'):
     world = []
 
     # add the world 'ground' as a big sphere
@@ -61,10 +80,10 @@ def spheres():
                radius=1,
                material=Metal((0.4, 0.2, 0.15), 0)))
 
-    return HitableList(world)
+    return build_world(world, 0, 1, accelerator, bvh_strategy)
 
 
-def moving_spheres():
+def moving_spheres(accelerator='linear_bvh', bvh_strategy='sah'):
     world = []
 
     # add the world 'ground' as a big sphere
@@ -120,5 +139,4 @@ def moving_spheres():
                radius=1,
                material=Metal((0.4, 0.2, 0.15), 0)))
 
-    return BVH_node(world, 0, 1)
-    # return HitableList(world)
+    return build_world(world, 0, 1, accelerator, bvh_strategy)
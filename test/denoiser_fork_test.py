@@ -0,0 +1,52 @@
+"""
+Denoises a render and then renders again with a new pool of workers, in a separate process: the workers are
+forked after the denoiser ran its parallel loops, and the process must still exit.
+
+Run from the root of the repository: PYTHONPATH=. python test/denoiser_fork_test.py or with pytest
+"""
+import os
+import subprocess
+import sys
+
+timeout = 300  # seconds, the first run compiles the integrator
+
+script = """
+import numpy as np
+
+from core import Camera, Multithread
+from films import Denoiser, AOV_CHANNELS
+from integrators import WavefrontPathTracer
+from scenes import moving_spheres
+
+width, height = 12, 8
+camera = Camera(lookfrom=np.array([13., 2., 3.]), lookat=np.zeros(3), vup=np.array([0., 1., 0.]), vertical_fov=20.,
+                aspect_ratio=width / height, aperture=0.05, focus_dist=10., time0=0., time1=1.)
+world = moving_spheres()
+
+integrator = WavefrontPathTracer(1, width, height, seed=5, aovs=tuple(AOV_CHANNELS))
+multithread = Multithread(camera, world, 2, silent=True)
+multithread.create_working_pool(width, height, aovs=integrator.aov_channels())
+multithread.run(integrator)
+Denoiser(1.).denoise_framebuffer(multithread.framebuffer)
+multithread.close()
+
+multithread = Multithread(camera, world, 2, silent=True)
+multithread.create_working_pool(width, height)
+multithread.run(WavefrontPathTracer(1, width, height, seed=5))
+multithread.close()
+"""
+
+
+def test_render_after_denoise_exits():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root] + [path for path in [env.get('PYTHONPATH')] if path])
+    try:
+        result = subprocess.run([sys.executable, '-c', script], env=env, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise Exception('the process did not exit after rendering with a pool forked after the denoiser')
+    assert result.returncode == 0
+
+
+if __name__ == '__main__':
+    test_render_after_denoise_exits()
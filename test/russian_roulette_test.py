@@ -0,0 +1,80 @@
+"""
+Compares the IterativePathTracer with Russian roulette against the recursive PathTracer on a scene with
+metal and glass spheres: the converged images must match within their noise. Prints the average path length
+of both integrators and the rays saved.
+
+Run from the root of the repository: PYTHONPATH=. python test/russian_roulette_test.py or with pytest
+"""
+import time
+
+import numpy as np
+
+from core import Camera, Multithread
+from films import LUMINANCE_WEIGHTS
+from geometries import Sphere
+from integrators import PathTracer, IterativePathTracer
+from materials import Lambertian, Dielectric, Metal
+from scenes.multiple_spheres import build_world
+
+n_cores = 1  # number of cores to use
+
+samples_per_pixel = 256  # number samples per pixel
+
+# canvas properties
+width = 24
+height = 16
+
+
+def metal_and_glass():
+    world = [Sphere(center=np.array([0., -1000., 0.]), radius=1000., material=Lambertian(np.array([0.5, 0.5, 0.5]))),
+             Sphere(center=np.array([0., 1., 0.]), radius=1., material=Dielectric(1.5)),
+             Sphere(center=np.array([-2., 1., 0.]), radius=1., material=Metal(np.array([0.8, 0.8, 0.8]), 0.)),
+             Sphere(center=np.array([2., 1., 0.]), radius=1., material=Metal(np.array([0.7, 0.6, 0.5]), 0.1)),
+             Sphere(center=np.array([0., 0.5, 2.]), radius=0.5, material=Lambertian(np.array([0.4, 0.2, 0.1])))]
+    return build_world(world, 0, 1)
+
+
+def render(integrator, camera, world):
+    # returns the luminance image, its standard error and the render stats
+    multithread = Multithread(camera, world, n_cores, silent=True)
+    multithread.create_working_pool(width, height)
+    start = time.time()
+    multithread.run(integrator)
+    stats = dict(multithread.stats, seconds=time.time() - start)
+
+    framebuffer = multithread.framebuffer
+    luminance = framebuffer.view().dot(LUMINANCE_WEIGHTS)
+    standard_error = np.sqrt(framebuffer.variance() / framebuffer.counts)
+    multithread.close()
+    return luminance, standard_error, stats
+
+
+def test_russian_roulette_matches_recursive():
+    camera = Camera(lookfrom=np.array([0., 2., 8.]), lookat=np.array([0., 1., 0.]), vup=np.array([0., 1., 0.]),
+                    vertical_fov=40, aspect_ratio=width / height, aperture=0., focus_dist=8, time0=0, time1=1)
+    world = metal_and_glass()
+
+    recursive, recursive_error, recursive_stats = render(PathTracer(samples_per_pixel, width, height, seed=1),
+                                                         camera, world)
+    iterative, iterative_error, iterative_stats = render(
+        IterativePathTracer(samples_per_pixel, width, height, seed=2), camera, world)
+
+    print('integrator\tpath length\tseconds')
+    print('recursive\t%.3f\t\t%.1f' % (recursive_stats['path_length'], recursive_stats['seconds']))
+    print('iterative\t%.3f\t\t%.1f' % (iterative_stats['path_length'], iterative_stats['seconds']))
+    print('rays saved: %.1f%%' % (100 * (1 - iterative_stats['path_length'] / recursive_stats['path_length'])))
+
+    # difference of every pixel in standard errors, pixels with no variance (only sky) must be equal
+    error = np.sqrt(recursive_error ** 2 + iterative_error ** 2)
+    noisy = error > 1e-9
+    z = (iterative - recursive)[noisy] / error[noisy]
+    print('mean luminance: recursive %.4f, iterative %.4f' % (recursive.mean(), iterative.mean()))
+    print('pixel differences: mean %.3f, |z| > 4 in %.2f%% of the pixels' % (z.mean(), 100 * np.mean(np.abs(z) > 4)))
+
+    assert np.allclose(iterative[~noisy], recursive[~noisy])
+    assert abs(iterative.mean() / recursive.mean() - 1) < 0.01
+    assert abs(z.mean()) < 0.2 and np.mean(np.abs(z) > 4) < 0.01
+
+
+if __name__ == '__main__':
+    test_russian_roulette_matches_recursive()
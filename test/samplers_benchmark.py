@@ -0,0 +1,86 @@
+"""
+Benchmark of the samplers in core/samplers.py: plots the sample patterns and prints the mean, standard
+deviation and maximum of their discrepancy over several iterations.
+
+Run from the root of the repository: PYTHONPATH=. python test/samplers_benchmark.py
+"""
+import time
+
+import numpy as np
+from matplotlib import pyplot as plt
+
+from core.samplers import RandomSampling, RegularSampling, JitteredSampling, HalfJitteredSampling, \
+    PoissonDiskSampling, NRooksSampling, SobolSampling, HaltonSampling, \
+    zeremba_discrepancy, zeremba_rms_discrepancy, strout_discrepancy
+
+
+def print_discrepancy(discrepancy, title):
+    print('%s\t%.4f\t%.4f\t%.4f' % (title, discrepancy.mean(), discrepancy.std(), discrepancy.max()))
+
+
+def plotter(samples, title, grid=None):
+    if grid is not None:
+        grid_i = grid[0]
+        grid_j = grid[1]
+        all_axis = np.zeros(samples.shape)
+        all_axis[:, 1] = 1
+
+    plt.scatter(samples[:, 0], samples[:, 1])
+    plt.title(title)
+    axes = plt.gca()
+    axes.set_xlim([-0.1, 1.1])
+    axes.set_ylim([-0.1, 1.1])
+    axes.set_aspect('equal')
+    if grid is not None:
+        for idx in range(len(grid_i)):
+            plt.plot([grid_i[idx], grid_i[idx]], all_axis[idx], alpha=0.2, color='b', dashes=[6, 2])
+        for idx in range(len(grid_j)):
+            plt.plot(all_axis[idx], [grid_j[idx], grid_j[idx]], alpha=0.2, color='b', dashes=[6, 2])
+
+        # add grid lines of the last elements of the square
+        plt.plot([all_axis[1], all_axis[1]], all_axis[idx], alpha=0.2, color='b', dashes=[6, 2])
+        plt.plot(all_axis[idx], [all_axis[1], all_axis[1]], alpha=0.2, color='b', dashes=[6, 2])
+
+    plt.show()
+
+
+def main(N=16, iters=100, plot=True):
+    rnd = RandomSampling(N=N)
+    reg = RegularSampling(N=N)
+    jit = JitteredSampling(N=N)
+    hjit = HalfJitteredSampling(N=N)
+    poisson = PoissonDiskSampling(N=N, d=0.2)
+    nrooks = NRooksSampling(N=N)
+    sobol = SobolSampling(N=N)
+    halton = HaltonSampling(N=N)
+
+    if plot:
+        rnd_samples = rnd()
+        reg_samples, reg_grid = reg(get_grid=True)
+        jit_samples, jit_grid = jit(get_grid=True)
+        hjit_samples, hjit_grid = hjit(get_grid=True)
+        poisson_samples = poisson()
+        nrooks_samples, nrooks_grid = nrooks(get_grid=True)
+
+        plotter(rnd_samples, 'random sampling')
+        plotter(reg_samples, 'regular sampling', grid=reg_grid)
+        plotter(jit_samples, 'jitered sampling', grid=jit_grid)
+        plotter(hjit_samples, 'half-jitered sampling', grid=hjit_grid)
+        plotter(poisson_samples, 'poisson disk sampling')
+        plotter(nrooks_samples, 'n-rooks sampling', grid=nrooks_grid)
+        plotter(sobol(), 'sobol sampling')
+        plotter(halton(), 'halton sampling')
+
+    samplings = [(rnd, 'random'), (reg, 'regular'), (jit, 'jittered'), (hjit, 'half-jittered'),
+                 (poisson, 'poisson'), (nrooks, 'n-rooks'), (sobol, 'sobol'), (halton, 'halton')]
+    for measure, name in [(zeremba_discrepancy, 'Zeremba'), (zeremba_rms_discrepancy, 'Zeremba RMS'),
+                          (strout_discrepancy, 'Strout')]:
+        start = time.time()
+        for sampling, sampling_name in samplings:
+            print_discrepancy(measure(sampling, iters), '%s disc. %s sampling:' % (name, sampling_name))
+        print('%s disc. computed in %.2fs' % (name, time.time() - start))
+        print()
+
+
+if __name__ == '__main__':
+    main()